@@ -0,0 +1,106 @@
+# Benchmark of crawl() (incl. the aggregation) against the local fixture server of crawl_server.py.
+# Needs requests_html and the Chromium of pyppeteer (downloaded once with 'pyppeteer-install'), but no internet.
+# Results are saved in the format of run.py and can be compared against a baseline (exit code 1 on a regression).
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('..')))
+from contextlib import redirect_stdout
+import argparse
+import io
+import json
+import platform
+import tempfile
+import time
+
+from benchmark.crawl_server import FixtureServer, add_page_arguments, create_server
+from benchmark.run import compare
+from dataset.creation.metrics import metrics
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Crawl the pages of a local fixture server and report pages/s, script time and failure handling.')
+    add_page_arguments(parser)
+    parser.add_argument('-o', '--out', metavar='FILE', type=str, default=None, help='save the results to this json file')
+    parser.add_argument('-b', '--baseline', metavar='FILE', type=str, default=None, help='compare the results against this json file')
+    parser.add_argument('-t', '--threshold', metavar='PERCENT', type=float, default=10., help='allowed slowdown against the baseline in percent (default 10)')
+    args = parser.parse_args()
+
+    server: FixtureServer = create_server(args, 0)
+    server.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            results: dict = run(server, Path(tmp))
+    finally:
+        server.stop()
+
+    crawl_result: dict = results['crawl']
+    print('pages:\t\t\t' + str(crawl_result['pages']))
+    print('pages/s:\t\t%.3f' % crawl_result['pages_per_second'])
+    print('fetch per page:\t\t%.3f ms' % (crawl_result['fetch_per_page'] * 1000))
+    print('script per page:\t%.3f ms' % (crawl_result['script_per_page'] * 1000))
+    print('aggregate:\t\t%.3f ms' % (crawl_result['aggregate'] * 1000))
+    print('failed:\t\t\t' + str(crawl_result['failed']) + ' (expected ' + str(crawl_result['expected_failed']) + ')')
+
+    if args.out is not None:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, 'w') as f:
+            f.write(json.dumps(results, indent=4))
+            f.write('\n')
+        print('created:\t' + args.out)
+
+    regression: bool = False
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline: dict = json.load(f)
+        regression = compare(results, baseline, args.threshold)
+    # every failing page (and only those) must be reported as failed
+    if len(crawl_result['unexpected']) > 0:
+        print('wrongly handled pages:\n' + '\n'.join(crawl_result['unexpected']))
+    if regression or len(crawl_result['unexpected']) > 0:
+        sys.exit(1)
+
+def run(server: FixtureServer, tmp: Path) -> dict:
+    from dataset.styleCrawling.crawler import crawl
+
+    urls_path: Path = tmp.joinpath('urls.txt')
+    with open(str(urls_path), 'w') as f:
+        f.write('\n'.join(server.urls()) + '\n')
+    crawl_path: Path = tmp.joinpath('crawl.json')
+
+    with redirect_stdout(io.StringIO()):
+        crawl(str(urls_path), str(crawl_path))
+    with open(str(crawl_path), 'r') as f:
+        log: dict = json.load(f)
+
+    report: dict = metrics.stage('crawl').report()
+    pages: int = report['items']
+    succeeded: int = len(log['succeeded'])
+    expected_failed: [str] = [server.url(i) for i in server.failing]
+    unexpected: [str] = sorted(set(expected_failed).symmetric_difference(log['failed']))
+    crawl_result: dict = {
+        'pages': pages,
+        'pages_per_second': report['items_per_second'],
+        'fetch_per_page': report['phases'].get('fetch', 0.) / pages if pages > 0 else -1.0,
+        'script_per_page': report['phases'].get('script', 0.) / succeeded if succeeded > 0 else -1.0,
+        'aggregate': report['phases'].get('aggregate', 0.),
+        'latency': report['latency'],
+        'failed': len(log['failed']),
+        'expected_failed': len(expected_failed),
+        'unexpected': unexpected,
+        'server': {'elements': server.elements, 'size': server.size, 'fonts': server.fonts, 'latency': server.latency, 'seed': server.seed},
+    }
+    return {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'crawl': crawl_result,
+        # comparable with run.py
+        'benchmarks': {
+            'crawl_page': {'seconds': report['wall_time'] / pages if pages > 0 else 0.},
+            'crawl_script': {'seconds': max(0., crawl_result['script_per_page'])},
+            'crawl_aggregate': {'seconds': crawl_result['aggregate']},
+        },
+    }
+
+
+if __name__ == '__main__':
+    main()
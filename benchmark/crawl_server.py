@@ -0,0 +1,134 @@
+# Local web server for the crawler benchmark: serves synthetic (or saved) pages, no internet needed.
+# The pages are seeded: size, number of text elements and their styles, latency and failures are the same for every run.
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('..')))
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import random
+import re
+import threading
+import time
+
+from benchmark import fixtures
+
+font_families: [str] = ['Arial, sans-serif', '"Times New Roman", serif', '"Open Sans", Arial, sans-serif', 'Roboto, sans-serif', 'monospace']
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Serve synthetic pages for the crawler until interrupted.')
+    parser.add_argument('-p', '--port', metavar='INT', type=int, default=8000, help='port (default 8000, 0 for any free port)')
+    add_page_arguments(parser)
+    args = parser.parse_args()
+
+    server: FixtureServer = create_server(args, args.port)
+    print('serving ' + str(server.pages) + ' pages:\t' + server.url(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+# The options of the pages, shared with benchmark/crawl.py
+def add_page_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('-n', '--pages', metavar='INT', type=int, default=50, help='number of pages (default 50)')
+    parser.add_argument('-e', '--elements', metavar='INT', type=int, default=200, help='text elements per page (default 200)')
+    parser.add_argument('-s', '--size', metavar='KB', type=int, default=50, help='min. size of a page, padded with hidden text (default 50)')
+    parser.add_argument('-f', '--fonts', metavar='INT', type=int, default=3, help='number of font families used (default 3)')
+    parser.add_argument('-l', '--latency', metavar='MS', type=float, default=50., help='delay of every response (default 50)')
+    parser.add_argument('--failure-rate', metavar='FLOAT', type=float, default=0.1, help='share of pages dropping the connection (default 0.1)')
+    parser.add_argument('--corpus', metavar='FOLDER', type=str, default=None, help='serve the html files of this folder instead of synthetic pages')
+    parser.add_argument('--seed', metavar='INT', type=int, default=0, help='seed of the pages (default 0)')
+
+def create_server(args, port: int) -> 'FixtureServer':
+    corpus: [Path] = sorted(Path(args.corpus).rglob('*.html')) if args.corpus is not None else None
+    return FixtureServer(port, args.pages if corpus is None else len(corpus), args.elements, args.size, args.fonts, args.latency, args.failure_rate, args.seed, corpus)
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, pages: int, elements: int, size: int, fonts: int, latency: float, failure_rate: float, seed: int, corpus: [Path] = None) -> None:
+        super().__init__(('127.0.0.1', port), FixtureHandler)
+        self.pages: int = pages
+        self.elements: int = elements
+        self.size: int = size
+        self.fonts: int = fonts
+        self.latency: float = latency
+        self.corpus: [Path] = corpus
+        self.seed: int = seed
+        # Decided upfront, so the benchmark knows which pages must fail
+        rng: random.Random = random.Random(seed)
+        self.failing: [int] = [i for i in range(pages) if rng.random() < failure_rate]
+        self.thread: threading.Thread = None
+
+    # Lower case: the crawler lower cases the urls
+    def url(self, index: int) -> str:
+        return 'http://127.0.0.1:' + str(self.server_address[1]) + '/page/' + str(index) + '.html'
+
+    def urls(self) -> [str]:
+        return [self.url(i) for i in range(self.pages)]
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+    def page(self, index: int) -> bytes:
+        if self.corpus is not None:
+            return self.corpus[index].read_bytes()
+        return synthetic_page(random.Random(self.seed * 1000003 + index), self.elements, self.size, self.fonts).encode('utf-8')
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        match = re.match(r'^/page/(\d+)\.html$', self.path)
+        if match is None or int(match.group(1)) >= self.server.pages:
+            self.send_error(404)
+            return
+        index: int = int(match.group(1))
+        time.sleep(self.server.latency / 1000.)
+        if index in self.server.failing:
+            # no response at all: the request of the crawler raises
+            self.close_connection = True
+            return
+
+        body: bytes = self.server.page(index)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+# elements: text elements with random styles (of the crawl fixture), size: min. size in KB
+def synthetic_page(rng: random.Random, elements: int, size: int, fonts: int) -> str:
+    families: [str] = font_families[0:max(1, fonts)]
+    html: [str] = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>fixture</title></head><body>']
+    for _ in range(elements):
+        style: str = 'font-family: ' + rng.choice(families) + '; '
+        style += 'font-size: ' + rng.choice(list(fixtures.crawl_data['font_size_dict'])) + '; '
+        style += 'font-style: ' + rng.choice(list(fixtures.crawl_data['font_style_dict'])) + '; '
+        style += 'font-weight: ' + rng.choice(list(fixtures.crawl_data['font_weight_dict'])) + '; '
+        style += 'text-decoration-line: ' + rng.choice(list(fixtures.crawl_data['text_decoration_line_dict'])) + '; '
+        style += 'color: ' + rng.choice(list(fixtures.crawl_data['font_color_dict'])) + '; '
+        style += 'background: ' + rng.choice(list(fixtures.crawl_data['background_color_dict'])) + ';'
+        tag: str = rng.choice(['p', 'div', 'span', 'a', 'h2'])
+        html.append('<' + tag + ' style=\'' + style + '\'>' + ' '.join(fixtures.random_word(rng) for _ in range(rng.randint(2, 20))) + '</' + tag + '>')
+
+    length: int = sum(len(part) for part in html)
+    padding: [str] = []
+    while length < size * 1024:
+        padding.append(fixtures.random_word(rng))
+        length += len(padding[-1]) + 1
+    if len(padding) > 0:
+        html.append('<div style="display: none;">' + ' '.join(padding) + '</div>')
+    html.append('</body></html>')
+    return '\n'.join(html)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# Synthetic, seeded fixtures for the benchmarks (no crawling, CEF or Tesseract needed).
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('..')))
+import codecs
+import json
+import random
+
+# A fixed crawl result with the keys of crawler.py
+crawl_data: dict = {
+    'succeeded': ['http://example.com', 'http://example.org'],
+    'failed': [],
+    'font_family_dict': {'arial': 0.4, 'times new roman': 0.3, 'open sans': 0.2, 'roboto': 0.1},
+    'font_size_dict': {'16px': 0.4, '12px': 0.3, '14px': 0.2, '13.3333px': 0.1},
+    'font_style_dict': {'normal': 0.9, 'italic': 0.1},
+    'font_weight_dict': {'400': 0.7, '700': 0.2, '300': 0.1},
+    'text_decoration_line_dict': {'none': 0.9, 'underline': 0.1},
+    'font_color_dict': {'rgb(0, 0, 0)': 0.4, 'rgb(34, 34, 34)': 0.3, 'rgb(255, 255, 255)': 0.2, 'rgba(0, 0, 0, 0.87)': 0.1},
+    'background_color_dict': {'rgb(255, 255, 255)': 0.6, 'rgb(0, 0, 0)': 0.2, 'rgba(0, 0, 0, 0)': 0.1, 'rgb(244, 244, 244)': 0.1},
+}
+
+letters: str = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz1234567890'
+
+def write_crawl(path: str) -> str:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(json.dumps(crawl_data, indent=4))
+        f.write('\n')
+    return path
+
+def sentences(count: int, seed: int = 0) -> [str]:
+    rng: random.Random = random.Random(seed)
+    return [' '.join(random_word(rng) for _ in range(rng.randint(3, 12))) + '.' for _ in range(count)]
+
+def random_word(rng: random.Random) -> str:
+    return ''.join(rng.choice(letters) for _ in range(rng.randint(2, 12)))
+
+# Evaluation csv (the columns analyse.py reads) of text and images_only documents with every layout
+def write_evaluation(path: str, layouts: [str], files: int, seed: int = 0) -> None:
+    rng: random.Random = random.Random(seed)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with codecs.open(path, 'w', 'utf-8-sig') as f:
+        f.write('path,tp_l,fp_l,fn_l,t_d,f_d,time_l,time_d\n')
+        for i in range(files):
+            layout: int = i % len(layouts)
+            if i % 2 == 0:
+                relative_path: str = 'only_text/arial/16px/normal/400/none/rgb_0_0_0/rgb_255_255_255/' + layouts[layout] + '/random'
+            else:
+                relative_path = 'images_only/rgb_255_255_255/' + str(layout)
+            counts: [int] = [rng.randint(0, 300), rng.randint(0, 20), rng.randint(0, 20), rng.randint(0, 300), rng.randint(0, 20), rng.randint(100000, 900000), rng.randint(100000, 900000)]
+            f.write(relative_path + '.txt,' + ','.join(str(count) for count in counts) + '\n')
+
+# Ideal boxes: 'word\t(left,top,width,height)' per line, the first line is the url (as written by render_html.py)
+def ideal_lines(rng: random.Random, words: int) -> [(str, int, int, int, int)]:
+    lines: [(str, int, int, int, int)] = []
+    left: int = 0
+    top: int = 0
+    for _ in range(words):
+        word: str = random_word(rng)
+        width: int = 8 * len(word)
+        if left + width > 1024:
+            left = 0
+            top += 20
+        lines.append((word, left, top, width, 18))
+        left += width + 6
+    return lines
+
+# Recognized boxes with controlled noise:
+#   jitter: max pixels every coordinate is moved, drop: share of missed words,
+#   extra: share of additional (false positive) boxes, typo: probability of a wrong character per word
+def recognized_lines(rng: random.Random, ideal: [(str, int, int, int, int)], jitter: int, drop: float, extra: float, typo: float) -> [(str, int, int, int, int)]:
+    lines: [(str, int, int, int, int)] = []
+    for word, left, top, width, height in ideal:
+        if rng.random() < drop:
+            continue
+        if rng.random() < typo:
+            i: int = rng.randrange(len(word))
+            word = word[:i] + rng.choice(letters) + word[i + 1:]
+        lines.append((word,
+            max(0, left + rng.randint(-jitter, jitter)),
+            max(0, top + rng.randint(-jitter, jitter)),
+            max(1, width + rng.randint(-jitter, jitter)),
+            max(1, height + rng.randint(-jitter, jitter))))
+    for _ in range(int(len(ideal) * extra)):
+        word = random_word(rng)
+        lines.append((word, rng.randint(0, 1000), rng.randint(0, 740), 8 * len(word), 18))
+    rng.shuffle(lines)
+    return lines
+
+# Writes 'files' ideal and recognized box files in the layout of the dataset
+def write_dataset(ideal_path: str, recognized_path: str, files: int, words: int, seed: int = 0,
+        jitter: int = 2, drop: float = 0.05, extra: float = 0.05, typo: float = 0.1) -> None:
+    rng: random.Random = random.Random(seed)
+    for i in range(files):
+        relative_path: str = 'only_text/arial/16px/normal/400/none/rgb_0_0_0/rgb_255_255_255/center/' + str(i)
+        ideal: [(str, int, int, int, int)] = ideal_lines(rng, words)
+        recognized: [(str, int, int, int, int)] = recognized_lines(rng, ideal, jitter, drop, extra, typo)
+
+        ideal_file: Path = Path(ideal_path).joinpath(relative_path + '.txt')
+        ideal_file.parent.mkdir(parents=True, exist_ok=True)
+        with codecs.open(str(ideal_file), 'w', 'utf-8') as f:
+            f.write('file://' + str(Path(ideal_path).joinpath(relative_path + '.html')) + '\n')
+            for line in ideal:
+                f.write('%s\t(%d,%d,%d,%d)\n' % line)
+
+        recognized_file: Path = Path(recognized_path).joinpath(relative_path + '.txt')
+        recognized_file.parent.mkdir(parents=True, exist_ok=True)
+        with codecs.open(str(recognized_file), 'w', 'utf-8') as f:
+            f.write('% Time (in microseconds):  ' + str(rng.randint(100000, 900000)) + '\n')
+            for line in recognized:
+                f.write('%s\t(%d,%d,%d,%d)\n' % line)
@@ -0,0 +1,273 @@
+# Offline benchmarks of the hot paths of the dataset creation and the evaluation.
+# Results are saved as json and can be compared against a baseline (exit code 1 on a regression).
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('..')))
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Callable, Dict
+import argparse
+import io
+import itertools
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import timeit
+
+from benchmark import fixtures
+from dataset.creation.generate_html import Generator, Layout, str_to_span, too_similar
+from evaluation.analyse import Analysis
+from evaluation.evaluation import evaluate, get_word_coordinate_dict, validate_coordinate
+
+root_path: Path = Path(__file__).parent.absolute().joinpath('..')
+# Entry points which are started for every (sharded) invocation
+entry_modules: [str] = ['dataset.creation.main', 'evaluation.evaluation', 'evaluation.visualise', 'recognition.recognise']
+# Must only be imported by the stages which use them
+heavy_modules: [str] = ['cefpython3', 'requests_html', 'pyppeteer', 'cv2', 'matplotlib']
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run the offline benchmarks (no crawling, CEF or Tesseract needed).')
+    parser.add_argument('-o', '--out', metavar='FILE', type=str, default=None, help='save the results to this json file')
+    parser.add_argument('-b', '--baseline', metavar='FILE', type=str, default=None, help='compare the results against this json file')
+    parser.add_argument('-t', '--threshold', metavar='PERCENT', type=float, default=10., help='allowed slowdown against the baseline in percent (default 10)')
+    parser.add_argument('-k', '--only', metavar='NAME', type=str, nargs='+', default=None, help='run only these benchmarks')
+    parser.add_argument('-r', '--repeat', metavar='INT', type=int, default=5, help='repetitions per benchmark, the fastest counts (default 5)')
+    parser.add_argument('--files', metavar='INT', type=int, default=200, help='box files of the evaluation fixture (default 200)')
+    parser.add_argument('--words', metavar='INT', type=int, default=300, help='words per box file of the evaluation fixture (default 300)')
+    parser.add_argument('--seed', metavar='INT', type=int, default=0, help='seed of the fixtures (default 0)')
+    parser.add_argument('--import-budget', metavar='MS', type=float, default=None, help='exit with 1 if an entry point takes longer to import or imports a heavy module')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results: dict = run(Path(tmp), args.only, args.repeat, args.files, args.words, args.seed)
+
+    if args.out is not None:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, 'w') as f:
+            f.write(json.dumps(results, indent=4))
+            f.write('\n')
+        print('created:\t' + args.out)
+
+    if check_analysis(results):
+        sys.exit(1)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline: dict = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+    if args.import_budget is not None:
+        if check_imports(results, args.import_budget):
+            sys.exit(1)
+
+# Generator without the bible (resources/bible is not part of the repository)
+class FixtureGenerator(Generator):
+    def prepare_bible(self) -> [str]:
+        return fixtures.sentences(1000)
+
+def run(tmp: Path, only: [str], repeat: int, files: int, words: int, seed: int) -> dict:
+    benchmarks: Dict[str, Callable[[], dict]] = {
+        # micro
+        'generate_file': lambda: bench_generate_file(tmp.joinpath('generate_file'), repeat, seed),
+        'too_similar': lambda: bench_too_similar(repeat),
+        'str_to_span': lambda: bench_str_to_span(repeat, seed),
+        'validate_coordinate': lambda: bench_validate_coordinate(repeat, seed),
+        'get_word_coordinate_dict': lambda: bench_get_word_coordinate_dict(repeat, seed),
+        # macro
+        'generate_html': lambda: bench_generate_html(tmp.joinpath('generate_html'), repeat, seed),
+        'evaluate': lambda: bench_evaluate(tmp.joinpath('evaluate'), repeat, files, words, seed),
+        'analyse': lambda: bench_analyse(tmp.joinpath('analyse'), repeat, files * 50, seed),
+    }
+    # startup
+    for module in entry_modules:
+        benchmarks['import_' + module.split('.')[-1]] = lambda module=module: bench_import(module, repeat)
+
+    results: dict = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'benchmarks': {},
+    }
+    for name, benchmark in benchmarks.items():
+        if only is not None and name not in only:
+            continue
+        result: dict = benchmark()
+        results['benchmarks'][name] = result
+        print('%-26s %12.3f ms' % (name, result['seconds'] * 1000))
+    return results
+
+# seconds: fastest time of one call
+def measure(function: Callable[[], None], repeat: int, number: int) -> dict:
+    times: [float] = timeit.repeat(function, repeat=repeat, number=number)
+    return {'seconds': min(times) / number, 'mean': sum(times) / len(times) / number, 'repeat': repeat, 'number': number}
+
+# Silence the progressbars and prints of the measured functions
+def quiet(function: Callable[[], None]) -> Callable[[], None]:
+    def wrapper() -> None:
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            function()
+    return wrapper
+
+def create_generator(out_path: Path, seed: int) -> FixtureGenerator:
+    crawl_data: dict = {category: list(values.keys())[0:1] for category, values in fixtures.crawl_data.items() if isinstance(values, dict)}
+    return FixtureGenerator(crawl_data, str(out_path), seed)
+
+def bench_generate_file(out_path: Path, repeat: int, seed: int) -> dict:
+    generator: FixtureGenerator = create_generator(out_path, seed)
+    content: [str] = fixtures.sentences(40, seed)
+    images: [str] = generator.get_images()
+    layouts = itertools.cycle([e for e in Layout])
+
+    def function() -> None:
+        generator.generate_file(
+            path=Path('only_text/arial/16px/normal/400/none/rgb_0_0_0/rgb_255_255_255/center/random'),
+            words=[sentence.split()[0] for sentence in content[0:10]],
+            sentences=content[10:20],
+            paragraphs=[' '.join(content[i:i + 3]) for i in range(20, 30)],
+            usernames=[sentence.split()[-1] for sentence in content[30:40]],
+            background_images=images,
+            style='font-family: arial; font-size: 16px; color: rgb(0, 0, 0); background: rgb(255, 255, 255); ',
+            layout=next(layouts),
+            )
+    return measure(function, repeat, 60)
+
+def bench_too_similar(repeat: int) -> dict:
+    pairs: [(str, str)] = list(itertools.product(fixtures.crawl_data['font_color_dict'], fixtures.crawl_data['background_color_dict']))
+
+    def function() -> None:
+        for font_color, background_color in pairs:
+            too_similar(font_color, background_color, 5.)
+    result: dict = measure(function, repeat, 20)
+    result['calls'] = len(pairs)
+    return result
+
+def bench_str_to_span(repeat: int, seed: int) -> dict:
+    paragraph: str = ' '.join(fixtures.sentences(20, seed))
+
+    def function() -> None:
+        str_to_span(paragraph)
+    result: dict = measure(function, repeat, 50)
+    result['words'] = len(paragraph.split())
+    return result
+
+def bench_validate_coordinate(repeat: int, seed: int) -> dict:
+    rng: random.Random = random.Random(seed)
+    ideal = fixtures.ideal_lines(rng, 1000)
+    recognized = fixtures.recognized_lines(rng, ideal, 2, 0., 0., 0.)
+    pairs: [(dict, dict)] = [(get_word_coordinate_dict('%s\t(%d,%d,%d,%d)' % i), get_word_coordinate_dict('%s\t(%d,%d,%d,%d)' % r)) for i, r in zip(ideal, recognized)]
+
+    def function() -> None:
+        for ideal_line, recognized_line in pairs:
+            validate_coordinate(ideal_line, recognized_line, 0.5)
+    result: dict = measure(function, repeat, 10)
+    result['calls'] = len(pairs)
+    return result
+
+def bench_get_word_coordinate_dict(repeat: int, seed: int) -> dict:
+    rng: random.Random = random.Random(seed)
+    lines: [str] = ['%s\t(%d,%d,%d,%d)\n' % line for line in fixtures.ideal_lines(rng, 1000)]
+
+    def function() -> None:
+        for line in lines:
+            get_word_coordinate_dict(line)
+    result: dict = measure(function, repeat, 10)
+    result['calls'] = len(lines)
+    return result
+
+def bench_generate_html(out_path: Path, repeat: int, seed: int) -> dict:
+    generator: FixtureGenerator = create_generator(out_path, seed)
+
+    def function() -> None:
+        generator.generate_html()
+    result: dict = measure(quiet(function), repeat, 1)
+    result['documents'] = len(list(out_path.rglob('*.html')))
+    return result
+
+def bench_evaluate(out_path: Path, repeat: int, files: int, words: int, seed: int) -> dict:
+    ideal_path: Path = out_path.joinpath('ideal')
+    recognized_path: Path = out_path.joinpath('recognized')
+    fixtures.write_dataset(str(ideal_path), str(recognized_path), files, words, seed)
+
+    def function() -> None:
+        evaluate(ideal_path, recognized_path, out_path.joinpath('results'), 0.5, 0.8)
+    result: dict = measure(quiet(function), repeat, 1)
+    result['files'] = files
+    result['words'] = words
+    return result
+
+# Text and images_only documents must be grouped under the same layouts
+def bench_analyse(out_path: Path, repeat: int, files: int, seed: int) -> dict:
+    evaluation_path: Path = out_path.joinpath('evaluation.csv')
+    fixtures.write_evaluation(str(evaluation_path), [e.name for e in Layout], files, seed)
+
+    def function() -> None:
+        Analysis(evaluation_path).group('layout')
+    result: dict = measure(function, repeat, 1)
+    result['files'] = files
+    result['layouts'] = sorted(Analysis(evaluation_path).values['layout'])
+    return result
+
+# Returns True if the analysis groups a layout under more than one value
+def check_analysis(results: dict) -> bool:
+    if 'analyse' not in results['benchmarks']:
+        return False
+    layouts: [str] = results['benchmarks']['analyse']['layouts']
+    if layouts != sorted(e.name for e in Layout):
+        print('analyse: layouts grouped as ' + ', '.join(layouts))
+        return True
+    return False
+
+# Imports the module in a fresh interpreter (the modules of the interpreter itself are not counted)
+def bench_import(module: str, repeat: int) -> dict:
+    code: str = (
+        'import json, sys, time\n'
+        'sys.path.append(%r)\n'
+        'start = time.perf_counter()\n'
+        'import %s\n'
+        'seconds = time.perf_counter() - start\n'
+        'print(json.dumps({"seconds": seconds, "heavy": [m for m in %r if m in sys.modules]}))\n'
+        ) % (str(root_path), module, heavy_modules)
+    times: [float] = []
+    heavy: [str] = []
+    for _ in range(repeat):
+        output: str = subprocess.check_output([sys.executable, '-c', code], cwd=str(root_path), stderr=subprocess.DEVNULL)
+        result: dict = json.loads(output.decode('utf-8').splitlines()[-1])
+        times.append(result['seconds'])
+        heavy = result['heavy']
+    return {'seconds': min(times), 'mean': sum(times) / len(times), 'repeat': repeat, 'number': 1, 'heavy': heavy}
+
+# Returns True if an entry point takes longer than budget (ms) to import or imports a heavy module
+def check_imports(results: dict, budget: float) -> bool:
+    over: bool = False
+    for name, result in results['benchmarks'].items():
+        if 'heavy' not in result:
+            continue
+        if result['seconds'] * 1000 > budget:
+            print('%-26s %12.3f ms  OVER BUDGET (%.0f ms)' % (name, result['seconds'] * 1000, budget))
+            over = True
+        if len(result['heavy']) > 0:
+            print('%-26s imports %s' % (name, ', '.join(result['heavy'])))
+            over = True
+    return over
+
+# Prints the change of every benchmark, returns True if one got slower than the threshold allows
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    regression: bool = False
+    print('\n%-26s %12s %12s %9s' % ('benchmark', 'baseline ms', 'current ms', 'change'))
+    for name, result in results['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            print('%-26s %12s %12.3f %9s' % (name, '-', result['seconds'] * 1000, 'new'))
+            continue
+        before: float = baseline['benchmarks'][name]['seconds']
+        change: float = (result['seconds'] - before) / before * 100 if before > 0 else 0.
+        slower: bool = change > threshold
+        regression = regression or slower
+        print('%-26s %12.3f %12.3f %+8.1f%%%s' % (name, before * 1000, result['seconds'] * 1000, change, '  REGRESSION' if slower else ''))
+    return regression
+
+
+if __name__ == '__main__':
+    main()
@@ -13,25 +13,29 @@ pipenv run python main.py -i ../styleCrawling/resources/urls_us -o ../../results
 ### Recognition ###
 echo '### Recognition ###'
 
-## Localisation
-echo '## Localisation'
+## Build
+echo '## Build'
 cd ../../recognition/localisation/
 ./setup.sh
-./build/localiser ../../results/dataset ../../results/dataset_tesseract_localised
+cd ../determination/
+./setup.sh
+cd ..
+
+## Localisation (one localiser per core, cached results are reused)
+echo '## Localisation'
+pipenv run python recognise.py localiser ../results/dataset ../results/dataset_tesseract_localised -w $(nproc)
 
 ## Determination on ideal
 echo '## Determination on ideal'
-cd ../determination/
-./setup.sh
-./build/determiner ../../results/dataset ../../results/dataset ../../results/dataset_tesseract_determiner
+pipenv run python recognise.py determiner ../results/dataset ../results/dataset_tesseract_determiner -b ../results/dataset -w $(nproc)
 
 ## Determination on localised (complete)
 echo '## Determination on localised (complete)'
-./build/determiner ../../results/dataset ../../results/dataset_tesseract_localised ../../results/dataset_tesseract_complete
+pipenv run python recognise.py determiner ../results/dataset ../results/dataset_tesseract_complete -b ../results/dataset_tesseract_localised -w $(nproc)
 
 ## Evaluation
 echo '## Evaluation'
-cd ../../evaluation
+cd ../evaluation
 # echo '# Determination'
 # pipenv run python evaluation.py ../results/dataset ../results/dataset_tesseract_determiner/ -cp 0.6 -lp 0.7 -o ../results/evaluation_determiner
 # echo '# Localised (complete)'
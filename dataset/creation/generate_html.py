@@ -1,19 +1,27 @@
 from optparse import OptionParser
 from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('../..')))
 import htmlmin
 import dominate
 from dominate.tags import body, head, script, style, div, p, span, link, img
 import lorem
 import re
-from enum import Enum
 import progressbar
 import codecs
+import hashlib
 import json
 import random
 import shutil
+import time
+from typing import Callable
 from colormath.color_diff import delta_e_cie2000
 from colormath.color_conversions import convert_color
 from colormath.color_objects import XYZColor, sRGBColor, LabColor
+from dataset.creation.metrics import metrics, StageMetrics
+from dataset.creation.profiling import profiler
+from dataset.creation.manifest import Manifest, get_document_id
+from dataset.creation.layout import Layout
 
 def main() -> None:
     parser = OptionParser()
@@ -30,11 +38,42 @@ def main() -> None:
                     '--out',
                     dest = 'out_path',
                     metavar = 'FOLDER' )
+    parser.add_option( '-s',
+                    '--seed',
+                    dest = 'seed',
+                    type = 'int',
+                    metavar = 'INT' )
+    parser.add_option( '--profile',
+                    dest = 'profile',
+                    metavar = 'FOLDER')
+    parser.add_option( '--profile-mode',
+                    dest = 'profile_mode',
+                    choices = ['sample', 'cprofile'],
+                    default = 'sample')
+    parser.add_option( '--profile-rate',
+                    dest = 'profile_rate',
+                    type = 'float',
+                    default = 100.,
+                    metavar = 'HZ')
     (options, _) = parser.parse_args()
 
-    generate_html(Path(options.crawl_data_path), int(options.top_values), Path(options.out_path))
+    profiler.configure(options.profile, options.profile_mode, options.profile_rate)
+    with profiler.profile('generate'):
+        generate_html(Path(options.crawl_data_path), int(options.top_values), Path(options.out_path), seed=options.seed)
+
+# on_generated is called with the path of every written html file
+# seed: the same seed (and crawl data) generates the same documents, a random one is drawn (and saved in the manifest) if None
+# on_document: is called with the path (relative to out_path, without suffix) and the html of every document,
+#   the html files are only written if keep_html is set (the images and the style are written to out_path anyway)
+def generate_html(crawl_data_path: str, top_values: int, out_path: str, on_generated: Callable[[str], None] = None, seed: int = None, on_document: Callable[[str, str], None] = None, keep_html: bool = False) -> None:
+    crawl_data: dict = load_crawl_data(crawl_data_path, top_values)
+    generator: Generator = Generator(crawl_data, out_path, seed)
+
+    print('Create Dataset:')
+    generator.generate_html(on_generated, on_document, keep_html)
 
-def generate_html(crawl_data_path: str, top_values: int, out_path: str) -> None:
+# The top values of every category
+def load_crawl_data(crawl_data_path: str, top_values: int) -> dict:
     crawl_data_path = str(Path(crawl_data_path))
 
     crawl_data: dict = {}
@@ -45,24 +84,27 @@ def generate_html(crawl_data_path: str, top_values: int, out_path: str) -> None:
     for category in tmp_data.keys():
         if isinstance(tmp_data[category], dict):
             crawl_data[category] = list(tmp_data[category].keys())[0:top_values]
+    return crawl_data
 
-    generator: Generator = Generator(crawl_data, out_path)
-
-    print('Create Dataset:')
-    generator.generate_html()
+# Upper bound of the documents generate_html() writes (too similar colors are skipped), e.g. for the progress of the renderer
+def estimate_documents(crawl_data_path: str, top_values: int) -> int:
+    crawl_data: dict = load_crawl_data(crawl_data_path, top_values)
+    text_documents: int = (len(content_variants) - 1) * len(Layout) * len(content_sources)
+    for category in ['font_family_dict', 'font_size_dict', 'font_style_dict', 'font_weight_dict', 'text_decoration_line_dict', 'font_color_dict', 'background_color_dict']:
+        text_documents *= len(crawl_data[category])
+    return text_documents + len(crawl_data['background_color_dict']) * len(Layout)
 
-class Layout(Enum):
-    center = 1
-    left = 2
-    top = 3
-    wall_of_text = 4
-    l_word_c_text = 5
-    words = 6
+content_sources: [str] = ['bible', 'lorem', 'random'] # all of them use usernames
+content_variants: [str] = ['images_only', 'only_text', 'with_images']
 
 class Generator(object):
-    def __init__(self, crawl_data: dict, out_path: str):
+    def __init__(self, crawl_data: dict, out_path: str, seed: int = None):
         self.script_path: Path = Path(__file__).parent.absolute()
 
+        # Every document gets its own rng derived from the seed and its attributes (see document_seed)
+        self.seed: int = seed if seed is not None else random.SystemRandom().randrange(2**32)
+        self.random: random.Random = random.Random(self.seed)
+
         self.save_directory: Path = Path(out_path)
         self.misc_path: Path = self.save_directory.joinpath('misc')
         self.misc_path.mkdir(parents=True, exist_ok=True)
@@ -81,16 +123,31 @@ class Generator(object):
         self.font_colors: [str] = crawl_data['font_color_dict']
         self.background_colors: [str] = crawl_data['background_color_dict']
         self.layouts = [e for e in Layout]
-        self.content_sources = ['bible', 'lorem', 'random'] # all of them use usernames
-        self.content_variants = ['images_only', 'only_text', 'with_images']
+        self.content_sources = content_sources
+        self.content_variants = content_variants
 
         self.word_list: [str] = self.prepare_words()
         self.bible_list: [str] = self.prepare_bible()
         self.img_list: [str] = self.prepare_imgs()
 
         self.min_delta_e: float = 5.
-
-    def generate_html(self):
+        self.on_generated: Callable[[str], None] = None
+        self.on_document: Callable[[str, str], None] = None
+        self.keep_html: bool = True
+        self.stage: StageMetrics = metrics.stage('generate')
+        self.manifest: Manifest = None
+        # font family and size of the current document, saved in the manifest to order the documents by (render_html.py --order)
+        self.attributes: dict = {}
+
+    def generate_html(self, on_generated: Callable[[str], None] = None, on_document: Callable[[str, str], None] = None, keep_html: bool = False):
+        self.on_generated = on_generated
+        self.on_document = on_document
+        self.keep_html = on_document is None or keep_html
+        self.stage.start()
+        print('seed:\t' + str(self.seed))
+        # path (without suffix) -> content addressed id of every document
+        self.manifest = Manifest(str(self.save_directory))
+        self.manifest.set_meta('seed', self.seed)
         iterations = (len(self.content_variants)-1) * len(self.font_families) * len(self.font_sizes) * len(self.font_styles) * len(self.font_weights) * len(self.text_decoration_lines) * len(self.font_colors) * len(self.background_colors) * len(self.layouts) * len(self.content_sources) + (len(self.background_colors) * len(self.layouts))
         curr_it = 0
         with progressbar.ProgressBar(max_value=iterations) as bar:
@@ -122,6 +179,7 @@ class Generator(object):
                                                         bar.update(curr_it)
                                                         curr_it += 1
                                                         if too_similar(font_color, background_color, self.min_delta_e):
+                                                            self.stage.count('too_similar')
                                                             continue
                                                         # Generate path
                                                         file_path_tmp: str = content_variant + '/' + font_family + '/' + font_size + '/' + font_style + '/' + font_weight + '/' + text_decoration_line + '/' + font_color + '/' + '/' + background_color + '/' + layout.name + '/' + content_source
@@ -139,6 +197,9 @@ class Generator(object):
                                                             layout=layout,
                                                             content_source=content_source,
                                                             )
+        self.manifest.close()
+        self.manifest = None
+        self.stage.stop()
 
 
     def prepare(self,
@@ -154,6 +215,7 @@ class Generator(object):
         layout: Layout=Layout.center,
         content_source: str='',
     ):
+        start: float = time.perf_counter()
 
         style: str = ''
         if len(font_family) > 0: style += 'font-family: ' + font_family + '; '
@@ -163,10 +225,16 @@ class Generator(object):
         if len(text_decoration_line) > 0: style += 'text-decoration-line: ' + text_decoration_line + '; '
         if len(font_color) > 0: style += 'color: ' + font_color + '; '
         if len(background_color) > 0: style += 'background: ' + background_color + '; '
+        self.attributes = {'font_family': font_family, 'font_size': font_size}
 
         if font_color[1:] == background_color[1:]:
             return
 
+        # Independent of the order (and number) of the generated documents
+        self.random = random.Random(document_seed(self.seed, content_variant, font_family, font_size, font_style, font_weight, text_decoration_line, font_color, background_color, layout.name, content_source, str(file_path)))
+        # lorem has no rng of its own but uses the module
+        random.seed(self.random.getrandbits(64))
+
         # Generate content
         words: [str] = ['']
         sentences: [str] = ['']
@@ -185,11 +253,11 @@ class Generator(object):
 
             elif content_source == 'bible':
                 for _ in range(10):
-                    words.append(random.choice(self.word_list))
-                    sentences.append(random.choice(self.bible_list))
+                    words.append(self.random.choice(self.word_list))
+                    sentences.append(self.random.choice(self.bible_list))
                     temp_paragraph = ''
-                    for _ in range(random.randint(2, 5)):
-                        temp_paragraph += random.choice(self.bible_list) + ' '
+                    for _ in range(self.random.randint(2, 5)):
+                        temp_paragraph += self.random.choice(self.bible_list) + ' '
                     paragraphs.append(temp_paragraph)
                     usernames.append(self.gen_username())
 
@@ -216,6 +284,8 @@ class Generator(object):
         if content_variant == 'with_images' or content_variant == 'images_only':
             background_images = self.get_images()
 
+        self.stage.add_phase('content', time.perf_counter() - start)
+
         # Generate and save document
         self.generate_file(
             path=file_path,
@@ -227,6 +297,7 @@ class Generator(object):
             style=style,
             layout=layout
             )
+        self.stage.add_item(time.perf_counter() - start)
 
     def generate_file(self, 
         path: Path=Path(''),
@@ -238,6 +309,7 @@ class Generator(object):
         style: str='',
         layout: Layout=Layout.center
         ) -> None:
+        start: float = time.perf_counter()
 
         misc_prefix = ''
         for _ in range(str(path).count('/')):
@@ -245,11 +317,12 @@ class Generator(object):
         misc_prefix += self.misc_path.name
         doc = dominate.document(title='generated')
 
+        images: str = ','.join(sorted(background_images))
         background_images = [str(Path(misc_prefix).joinpath(img)) for img in background_images]
 
         indexes: [int] = []
         possible_indexes: [int] = [0,1,2,3,4,5,6,7,8]
-        random.shuffle(possible_indexes)
+        self.random.shuffle(possible_indexes)
         for _ in range(len(background_images)):
             indexes.append(possible_indexes.pop())
 
@@ -489,47 +562,64 @@ class Generator(object):
             script(type='text/javascript', src=str(Path(misc_prefix).joinpath('script.js')))
 
 
+        html: str = htmlmin.minify(doc.render(), remove_empty_space=True)
+        document_id: str = get_document_id(html)
+        written: float = time.perf_counter()
+        self.stage.add_phase('dom', written - start)
+
         out_path: Path = self.save_directory.joinpath(path)
-        Path(out_path).parent.mkdir(parents=True, exist_ok=True)
-        with codecs.open(str(out_path)+'.html', 'w', 'utf-8-sig') as f:
-            f.write(htmlmin.minify(doc.render(), remove_empty_space=True))
+        if self.keep_html:
+            Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+            with codecs.open(str(out_path)+'.html', 'w', 'utf-8-sig') as f:
+                f.write(html)
+        # only written documents are 'generated' (the html tree is complete for them)
+        if self.manifest is not None:
+            self.manifest.add(str(path), document_id, 'generated' if self.keep_html else None)
+            self.manifest.set_attributes(str(path), dict(self.attributes, images=images))
+        self.stage.add_phase('write', time.perf_counter() - written)
+
+        if self.on_document is not None:
+            self.on_document(str(path), html)
+        if self.on_generated is not None and self.keep_html:
+            self.on_generated(str(out_path)+'.html')
 
     def get_images(self) -> [str]:
         imgs: [str] = ['']
 
-        img_count: int = random.randint(1, 8)
+        img_count: int = self.random.randint(1, 8)
 
         for _ in range(img_count):
-            imgs.append(random.choice(self.img_list))
+            imgs.append(self.random.choice(self.img_list))
         imgs.pop(0)
-        return list(set(imgs))
+        # without duplicates, in the drawn order (a set would depend on the hash seed)
+        return list(dict.fromkeys(imgs))
 
     def gen_username(self) -> str:
-        choice: int = random.randint(0, 3)
+        choice: int = self.random.randint(0, 3)
 
         username: str = ''
         # word
         if choice == 0:
-            times: int = random.randint(1, 3)
+            times: int = self.random.randint(1, 3)
             for _ in range(times):
-                username += random.choice(self.word_list)
+                username += self.random.choice(self.word_list)
 
         # word + number
         elif choice == 1:
-            word: str = random.choice(self.word_list)
-            number: int = random.randint(0, 99999)
+            word: str = self.random.choice(self.word_list)
+            number: int = self.random.randint(0, 99999)
             username = word + str(number)
 
         # word with numbers
         elif choice == 2:
-            word: str = random.choice(self.word_list)
-            count: int = random.randint(0, len(word))
+            word: str = self.random.choice(self.word_list)
+            count: int = self.random.randint(0, len(word))
             positions: [int] = list(set(range(len(word))))
             letters: [str] = list(word)
 
             for _ in range(count):
-                number = random.randint(0, 99)
-                position = random.choice(positions)
+                number = self.random.randint(0, 99)
+                position = self.random.choice(positions)
                 letters.insert(position, str(number))
                 positions.remove(position)
             username = ''.join(letters)
@@ -537,24 +627,24 @@ class Generator(object):
         # random letters & numbers
         elif choice == 3:
             letters: str = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz1234567890'
-            length: int = random.randint(4, 10)
-            username = ''.join(random.choice(letters) for i in range(length))
+            length: int = self.random.randint(4, 10)
+            username = ''.join(self.random.choice(letters) for i in range(length))
 
         return username
 
     def gen_random_word(self) -> str:
         letters: str = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz1234567890'
-        letters_count: int = random.randint(3, 13)
+        letters_count: int = self.random.randint(3, 13)
 
         word: str = ''
 
         for _ in range(letters_count):
-            word += random.choice(list(letters))
+            word += self.random.choice(list(letters))
 
         return word
 
     def gen_random_sentence(self) -> str:
-        words_count: int = random.randint(3, 10)
+        words_count: int = self.random.randint(3, 10)
         
         sentence: str = ''
 
@@ -564,7 +654,7 @@ class Generator(object):
         return sentence
 
     def gen_random_paragraph(self) -> str:
-            words_count: int = random.randint(3, 10)
+            words_count: int = self.random.randint(3, 10)
             
             paragraph: str = ''
 
@@ -576,7 +666,7 @@ class Generator(object):
     def prepare_imgs(self) -> [str]:
         img_list: [str] = ['']
 
-        for path in self.img_path.rglob('*.jpg'):
+        for path in sorted(self.img_path.rglob('*.jpg')):
             i = str(path).find('imgs')
             img_list.append(str(path)[i:])
 
@@ -618,6 +708,11 @@ def str_to_span(content: str):
     return paragraph
 
 
+# Seed of a single document: the same for the same global seed and attributes on every machine (unlike hash())
+def document_seed(seed: int, *attributes: str) -> int:
+    key: str = '\t'.join([str(seed)] + [str(attribute) for attribute in attributes])
+    return int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest()[:8], 'big')
+
 def normalize_path(path: str):
     return path.replace('(', '_').replace(')', '').replace(',', '').replace(' ', '_')
 
@@ -0,0 +1,10 @@
+# The layouts of the generated documents, without the dependencies of generate_html.py (analyse.py only needs their names).
+from enum import Enum
+
+class Layout(Enum):
+    center = 1
+    left = 2
+    top = 3
+    wall_of_text = 4
+    l_word_c_text = 5
+    words = 6
@@ -3,13 +3,20 @@ import sys
 path: Path = Path(__file__).parent.absolute()
 sys.path.append(str(path.joinpath("../..")))
 from optparse import OptionParser
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Iterator
+import multiprocessing
+import os
+import threading
+import queue
 
-from dataset.styleCrawling.crawler import crawl
-from dataset.creation.generate_html import generate_html
-from dataset.creation.render_html import render_html
-from evaluation.add_boxes import add_boxes
-from evaluation.visualise import visualise_crawl
-from dataset.creation.zip_dataset import create_zip
+# The stages are imported when they run: CEF, pyppeteer, cv2 and matplotlib take seconds to import
+from dataset.creation.metrics import metrics
+from dataset.creation.profiling import profiler
+from dataset.creation.manifest import manifest_name
+
+# Seconds a queue between the processes of the pipeline is waited for before checking if the other side is still alive
+queue_timeout: float = 1.
 
 def main() -> None:
     parser = OptionParser()
@@ -27,6 +34,16 @@ def main() -> None:
                     '--skip',
                     dest = 'skip',
                     default = '')
+    parser.add_option( '--delta-e',
+                    dest = 'delta_e',
+                    type = 'float',
+                    default = 2.3)
+    parser.add_option( '--size-buckets',
+                    dest = 'size_buckets',
+                    metavar = 'PX,PX,...')
+    parser.add_option( '--seed',
+                    dest = 'seed',
+                    type = 'int')
     parser.add_option( '-c',
                     '--crawl-name',
                     dest = 'crawl_name',
@@ -44,16 +61,123 @@ def main() -> None:
                     dest = 'add_boxes',
                     action = 'store_true',
                     default = False)
+    parser.add_option( '--clip',
+                    dest = 'clip',
+                    action = 'store_true',
+                    default = False)
+    parser.add_option( '--grayscale',
+                    dest = 'grayscale',
+                    action = 'store_true',
+                    default = False)
+    parser.add_option( '--swap',
+                    dest = 'swap',
+                    action = 'store_true',
+                    default = False)
+    parser.add_option( '--order',
+                    dest = 'order',
+                    action = 'store_true',
+                    default = False)
+    parser.add_option( '--page-timeout',
+                    dest = 'page_timeout',
+                    type = 'float',
+                    default = 60.,
+                    metavar = 'SECONDS')
+    parser.add_option( '--page-retries',
+                    dest = 'page_retries',
+                    type = 'int',
+                    default = 1)
+    parser.add_option( '--restart-every',
+                    dest = 'restart_every',
+                    type = 'int',
+                    metavar = 'DOCUMENTS')
+    parser.add_option( '--max-rss',
+                    dest = 'max_rss',
+                    type = 'int',
+                    metavar = 'MB')
+    parser.add_option( '--resume',
+                    dest = 'resume',
+                    action = 'store_true',
+                    default = False)
+    parser.add_option( '--scales',
+                    dest = 'scales',
+                    default = '1',
+                    metavar = 'SCALE,SCALE,...')
+    parser.add_option( '-e',
+                    '--recognise',
+                    dest = 'recognise',
+                    action = 'store_true',
+                    default = False)
+    parser.add_option( '--recognise-workers',
+                    dest = 'recognise_workers',
+                    type = 'int',
+                    default = 1)
+    parser.add_option( '--recognise-retries',
+                    dest = 'recognise_retries',
+                    type = 'int',
+                    default = 2)
+    parser.add_option( '--fake-recogniser',
+                    dest = 'fake_recogniser',
+                    action = 'store_true',
+                    default = False)
     parser.add_option( '-v',
                     '--visualise',
                     dest = 'visualise',
                     action = 'store_true',
                     default = False)
+    parser.add_option( '--visualise-top',
+                    dest = 'visualise_top',
+                    type = 'int',
+                    default = 10)
+    parser.add_option( '--visualise-format',
+                    dest = 'visualise_format',
+                    choices = ['pdf', 'png'],
+                    default = 'pdf')
     parser.add_option( '-z',
                     '--zip',
                     dest = 'create_zip',
                     action = 'store_true',
                     default = False)
+    parser.add_option( '-p',
+                    '--pipeline',
+                    dest = 'pipeline',
+                    action = 'store_true',
+                    default = False)
+    parser.add_option( '--in-memory',
+                    dest = 'in_memory',
+                    action = 'store_true',
+                    default = False)
+    parser.add_option( '--keep-html',
+                    dest = 'keep_html',
+                    action = 'store_true',
+                    default = False)
+    parser.add_option( '--queue-size',
+                    dest = 'queue_size',
+                    type = 'int',
+                    default = 64)
+    parser.add_option( '--box-workers',
+                    dest = 'box_workers',
+                    type = 'int',
+                    default = 1)
+    parser.add_option( '--zip-workers',
+                    dest = 'zip_workers',
+                    type = 'int',
+                    default = 1)
+    parser.add_option( '-m',
+                    '--metrics-name',
+                    dest = 'metrics_name',
+                    default = 'metrics.json')
+    parser.add_option( '--profile',
+                    dest = 'profile',
+                    metavar = 'FOLDER')
+    parser.add_option( '--profile-mode',
+                    dest = 'profile_mode',
+                    choices = ['sample', 'cprofile'],
+                    default = 'sample')
+    parser.add_option( '--profile-rate',
+                    dest = 'profile_rate',
+                    type = 'float',
+                    default = 100.,
+                    metavar = 'HZ')
 
     (options, _) = parser.parse_args()
 
@@ -75,33 +199,205 @@ def main() -> None:
     crawl_results: str = str(out_path.joinpath(options.crawl_name).absolute())
     html_results: str = str(out_path.joinpath(options.generated_name).absolute())
     render_results: str = str(out_path.joinpath(options.render_name).absolute())
-
+    boxes_results: Path = out_path.joinpath(options.render_name + '_boxes')
+    profiler.configure(options.profile, options.profile_mode, options.profile_rate)
 
     if 'c' not in skip:
+        from dataset.styleCrawling.crawler import crawl
         print('Crawling...')
-        crawl(crawl_urls, crawl_results)
+        with profiler.profile('crawl'):
+            crawl(crawl_urls, crawl_results)
 
-    if 'g' not in skip:
-        print('Generating HTML...')
-        generate_html(crawl_results, int(options.top_values), html_results)
+        from dataset.styleCrawling.canonicalise import canonicalise
+        print('Canonicalising Crawl Data...')
+        with profiler.profile('canonicalise'):
+            size_buckets: [float] = [float(size) for size in options.size_buckets.split(',')] if options.size_buckets is not None else None
+            canonicalise(crawl_results, crawl_results, options.delta_e, size_buckets)
 
-    if 'r' not in skip:
-        print('Rendering HTML...')
-        render_html(html_results, render_results)
+    if options.pipeline and 'r' not in skip:
+        print('Generating, Rendering' + (', Adding Boxes' if options.add_boxes else '') + (', Zipping Dataset' if options.create_zip else '') + '...')
+        with profiler.profile('pipeline'):
+            run_pipeline(options, crawl_results, html_results, render_results, boxes_results)
+
+    else:
+        if 'g' not in skip:
+            from dataset.creation.generate_html import generate_html
+            print('Generating HTML...')
+            with profiler.profile('generate'):
+                generate_html(crawl_results, int(options.top_values), html_results, seed=options.seed)
+
+        if 'r' not in skip:
+            from dataset.creation.render_html import render_html
+            print('Rendering HTML...')
+            with profiler.profile('render'):
+                render_html(html_results, render_results, clip=options.clip, grayscale=options.grayscale, swap=options.swap, order=options.order,
+                            page_timeout=options.page_timeout, page_retries=options.page_retries, restart_every=options.restart_every, max_rss=options.max_rss, resume=options.resume,
+                            scales=[float(scale) for scale in options.scales.split(',')])
+
+        if options.add_boxes:
+            from evaluation.add_boxes import add_boxes
+            print('Adding Boxes...')
+            with profiler.profile('add_boxes'):
+                add_boxes(render_results, render_results, boxes_results, options.box_workers)
+
+    if options.recognise:
+        from recognition.recognise import recognise_dataset
+        print('Recognising Dataset...')
+        with profiler.profile('recognise'):
+            recognise_dataset(render_results, str(out_path.joinpath('ocr_cache').absolute()), options.recognise_workers, options.recognise_retries, options.fake_recogniser)
 
-    if options.add_boxes:
-        print('Adding Boxes...')
-        boxes_results: Path = out_path.joinpath(options.render_name + '_boxes')
-        add_boxes(render_results, render_results, boxes_results)
-    
     if options.visualise:
+        from evaluation.visualise import visualise_crawl
         print('Visualising Crawl Data...')
         visualise_results: Path = out_path.joinpath('visualise')
-        visualise_crawl(crawl_results, visualise_results)
+        with profiler.profile('visualise'):
+            visualise_crawl(crawl_results, visualise_results, options.visualise_top, options.visualise_format)
 
-    if options.create_zip:
+    if options.create_zip and not (options.pipeline and 'r' not in skip):
+        from dataset.creation.zip_dataset import create_zip
         print('Zipping Dataset...')
-        create_zip(out_path)
+        with profiler.profile('zip'):
+            create_zip(out_path, options.zip_workers)
+
+    metrics.save(str(out_path.joinpath(options.metrics_name).absolute()))
+
+
+# Runs generate -> render -> add_boxes / zip at the same time:
+#   the generator runs in its own process and hands the html files over a bounded queue to the renderer,
+#   every rendered document is passed on to the box workers and streamed into the archive(s) of the dataset.
+def run_pipeline(options, crawl_results: str, html_results: str, render_results: str, boxes_results: Path) -> None:
+    from dataset.creation.render_html import render_html
+    # spawn: CEF must not be forked
+    context = multiprocessing.get_context('spawn')
+
+    documents = None
+    reports = None
+    generator = None
+    # set once the renderer stopped, the generator stops as well instead of blocking on the full queue
+    rendered = context.Event()
+    if 'g' not in options.skip:
+        documents = context.Queue(maxsize=options.queue_size)
+        reports = context.Queue()
+        generator = context.Process(target=generate_documents, args=(crawl_results, int(options.top_values), html_results, options.seed, documents, reports, profiler.configuration(), options.in_memory, options.keep_html, rendered))
+        generator.start()
+
+    box_executor: ProcessPoolExecutor = None
+    box_stage = None
+    if options.add_boxes:
+        from evaluation.add_boxes import add_boxes_job
+        box_stage = metrics.stage('add_boxes')
+        box_executor = ProcessPoolExecutor(max_workers=options.box_workers, mp_context=context)
+        box_stage.start()
+
+    archive: queue.Queue = None
+    archivers: [threading.Thread] = []
+    if options.create_zip:
+        from dataset.creation.zip_dataset import write_zip
+        metrics.stage('zip').start()
+        archive = queue.Queue()
+        for i in range(options.zip_workers):
+            zip_path: str = render_results + ('.zip' if options.zip_workers == 1 else '.%03d.zip' % (i + 1))
+            archivers.append(threading.Thread(target=write_zip, args=(zip_path, iter(archive.get, None))))
+            archivers[-1].start()
+
+    def on_rendered(rendered: str) -> None:
+        relative_path: str = rendered[len(render_results) + 1:]
+        if box_executor is not None:
+            job = (rendered + '.png', rendered + '.txt', str(boxes_results.joinpath(relative_path + '.png')))
+            box_executor.submit(add_boxes_job, job).add_done_callback(lambda future: report_job(future, box_stage))
+        if archive is not None:
+            archive.put((rendered + '.png', relative_path + '.png', 0))
+            archive.put((rendered + '.txt', relative_path + '.txt', 0))
+
+    try:
+        if documents is not None:
+            from dataset.creation.generate_html import estimate_documents
+            render_html(html_results, render_results, receive_documents(documents, generator), on_rendered, estimate_documents(crawl_results, int(options.top_values)), options.clip, options.grayscale, options.swap, options.order,
+                        options.page_timeout, options.page_retries, options.restart_every, options.max_rss, options.resume,
+                        [float(scale) for scale in options.scales.split(',')])
+        else:
+            render_html(html_results, render_results, None, on_rendered, None, options.clip, options.grayscale, options.swap, options.order,
+                        options.page_timeout, options.page_retries, options.restart_every, options.max_rss, options.resume,
+                        [float(scale) for scale in options.scales.split(',')])
+    finally:
+        rendered.set()
+    if archive is not None:
+        archive.put((str(Path(render_results).joinpath(manifest_name)), manifest_name, 0))
+
+    if generator is not None:
+        metrics.add_report('generate', get_alive(reports, generator.is_alive, 'the generator stopped without sending its metrics'))
+        generator.join()
+    if box_executor is not None:
+        box_executor.shutdown(wait=True)
+        box_stage.stop()
+    for _ in archivers:
+        archive.put(None)
+    for archiver in archivers:
+        archiver.join()
+    if options.create_zip:
+        metrics.stage('zip').stop()
+
+# Runs in its own process, the metrics of the generator are sent back over reports
+# in_memory: the html of the documents is sent over documents (and only written with keep_html), else their paths
+# rendered: set by the renderer once it stopped (the generator raises instead of waiting for it forever, as if the renderer died)
+def generate_documents(crawl_results: str, top_values: int, html_results: str, seed: int, documents, reports, profile: (str, str, float), in_memory: bool = False, keep_html: bool = False, rendered = None) -> None:
+    from dataset.creation.generate_html import generate_html
+    parent: int = os.getppid()
+    renderer_alive: Callable[[], bool] = lambda: os.getppid() == parent and (rendered is None or not rendered.is_set())
+    put: Callable[[object], None] = lambda document: put_alive(documents, document, renderer_alive, 'the renderer stopped, stopping the generator')
+    profiler.configure(*profile)
+    with profiler.profile('generate'):
+        if in_memory:
+            generate_html(crawl_results, top_values, html_results, None, seed, lambda path, html: put((path, html)), keep_html)
+        else:
+            generate_html(crawl_results, top_values, html_results, put, seed)
+    put(None)
+    reports.put(metrics.stage('generate').report())
+
+# The documents of the generator for the renderer, render_html.pending_document while the generator is behind
+# (the renderer keeps its message loop running), raises if the generator stopped before it sent all documents
+def receive_documents(documents, generator) -> Iterator:
+    from dataset.creation.render_html import pending_document
+    while True:
+        try:
+            document = documents.get(timeout=0.001)
+        except queue.Empty:
+            if generator.is_alive():
+                yield pending_document
+                continue
+            document = get_alive(documents, generator.is_alive, 'the generator stopped (exit code ' + str(generator.exitcode) + ') before it sent all documents')
+        if document is None:
+            return
+        yield document
+
+# Blocking put on a bounded queue, raises with message once alive() is False (the receiving process stopped)
+def put_alive(q, item, alive: Callable[[], bool], message: str) -> None:
+    while True:
+        try:
+            q.put(item, timeout=queue_timeout)
+            return
+        except queue.Full:
+            if not alive():
+                raise RuntimeError(message)
+
+# Blocking get, raises with message if alive() is False and nothing arrives (the sending process stopped)
+def get_alive(q, alive: Callable[[], bool], message: str):
+    while True:
+        try:
+            return q.get(timeout=queue_timeout)
+        except queue.Empty:
+            if not alive():
+                # the items sent right before it stopped are still in the pipe
+                try:
+                    return q.get(timeout=queue_timeout)
+                except queue.Empty:
+                    raise RuntimeError(message)
+
+def report_job(future: Future, stage) -> None:
+    if future.exception() is not None:
+        print(future.exception())
+    else:
+        stage.add_item(future.result())
 
 
 if __name__ == '__main__':
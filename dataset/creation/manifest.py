@@ -0,0 +1,107 @@
+# Index of the documents of a tree (html, dataset, ...) in '<tree>/manifest.sqlite'.
+# Stores the relative path (without suffix), the content addressed id and which stages are done for every document,
+# so the consumers neither have to walk the tree nor derive paths by string replacement.
+# The generator writes the manifest of the html tree, the renderer the one of the dataset tree.
+from pathlib import Path
+from typing import Dict, Iterator
+import hashlib
+import sqlite3
+
+manifest_name: str = 'manifest.sqlite'
+
+class Manifest(object):
+    # batch: documents per transaction
+    def __init__(self, tree_path: str, batch: int = 1000) -> None:
+        self.tree_path: Path = Path(tree_path).absolute()
+        self.tree_path.mkdir(parents=True, exist_ok=True)
+        self.connection: sqlite3.Connection = sqlite3.connect(str(self.tree_path.joinpath(manifest_name)))
+        self.connection.execute('CREATE TABLE IF NOT EXISTS documents (path TEXT PRIMARY KEY, id TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS status (path TEXT, stage TEXT, PRIMARY KEY (path, stage))')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        # Generation metadata of a document, e.g. its font family (to order the documents by)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS attributes (path TEXT, key TEXT, value TEXT, PRIMARY KEY (path, key))')
+        self.connection.commit()
+        self.pending: int = 0
+        self.batch: int = batch
+
+    # path: relative to the tree, without suffix
+    def add(self, path: str, document_id: str = '', stage: str = None) -> None:
+        self.connection.execute('INSERT OR REPLACE INTO documents (path, id) VALUES (?, ?)', (path, document_id))
+        if stage is not None:
+            self.connection.execute('INSERT OR IGNORE INTO status (path, stage) VALUES (?, ?)', (path, stage))
+        self.written()
+
+    def set_status(self, path: str, stage: str) -> None:
+        self.connection.execute('INSERT OR IGNORE INTO status (path, stage) VALUES (?, ?)', (path, stage))
+        self.written()
+
+    def get_id(self, path: str) -> str:
+        row = self.connection.execute('SELECT id FROM documents WHERE path = ?', (path,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_attributes(self, path: str, attributes: Dict[str, str]) -> None:
+        self.connection.executemany('INSERT OR REPLACE INTO attributes (path, key, value) VALUES (?, ?, ?)', [(path, key, str(value)) for key, value in attributes.items()])
+        self.written()
+
+    def get_attributes(self, path: str) -> Dict[str, str]:
+        return {key: value for key, value in self.connection.execute('SELECT key, value FROM attributes WHERE path = ?', (path,))}
+
+    def set_meta(self, key: str, value: str) -> None:
+        self.connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+        self.written()
+
+    def get_meta(self, key: str) -> str:
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    # Relative paths in the order they were added (or by the values of the attributes in order), only of the documents which passed 'stage' (if given)
+    def paths(self, stage: str = None, order: [str] = None) -> Iterator[str]:
+        order = order if order is not None else []
+        query: str = 'SELECT documents.path FROM documents'
+        parameters: list = []
+        for i, key in enumerate(order):
+            query += ' LEFT JOIN attributes a%d ON a%d.path = documents.path AND a%d.key = ?' % (i, i, i)
+            parameters.append(key)
+        if stage is not None:
+            query += ' JOIN status ON documents.path = status.path WHERE status.stage = ?'
+            parameters.append(stage)
+        query += ' ORDER BY ' + ''.join(['a%d.value, ' % i for i in range(len(order))]) + 'documents.rowid'
+        cursor = self.connection.execute(query, parameters)
+        for row in cursor:
+            yield row[0]
+
+    def count(self, stage: str = None) -> int:
+        if stage is None:
+            return self.connection.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+        return self.connection.execute('SELECT COUNT(*) FROM status WHERE stage = ?', (stage,)).fetchone()[0]
+
+    # Commits in batches, a transaction per document would slow down the generator
+    def written(self) -> None:
+        self.pending += 1
+        if self.pending >= self.batch:
+            self.commit()
+
+    def commit(self) -> None:
+        self.connection.commit()
+        self.pending = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.connection.close()
+
+def has_manifest(tree_path: str) -> bool:
+    return Path(tree_path).joinpath(manifest_name).exists()
+
+# The files with 'suffix' of the documents in the tree: from the manifest if there is one, else by walking the tree
+def get_files(tree_path: str, suffix: str, stage: str = None) -> [Path]:
+    tree_path = Path(tree_path).absolute()
+    if not has_manifest(tree_path):
+        return sorted(tree_path.rglob('*' + suffix))
+    manifest: Manifest = Manifest(tree_path)
+    files: [Path] = [tree_path.joinpath(path + suffix) for path in manifest.paths(stage)]
+    manifest.close()
+    return files
+
+# Content addressed id: documents with the same html have the same id
+def get_document_id(html: str) -> str:
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()[:16]
@@ -0,0 +1,245 @@
+# Timing, throughput and memory measurements of the pipeline stages.
+# Every stage records into the process wide 'metrics', main.py saves them as a json report per run.
+from pathlib import Path
+from array import array
+from contextlib import contextmanager
+from typing import Dict
+import json
+import math
+import os
+import sys
+import threading
+import time
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+class StageMetrics(object):
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.start_time: float = 0.
+        self.end_time: float = 0.
+        self.wall_time: float = 0.
+        self.latencies: array = array('d')      # seconds per item
+        self.phases: Dict[str, float] = {}      # seconds per sub-phase
+        self.counters: Dict[str, int] = {}
+        self.rss_start: int = 0                 # bytes, current RSS when the stage started
+        self.rss_end: int = 0                   # bytes, current RSS when the stage stopped
+        self.rss_delta: int = 0                 # bytes, RSS the stage added (summed over its runs)
+        self.peak_rss: int = 0                  # bytes, peak RSS of the process while the stage ran (see reset_peak_rss)
+        self.process_peak_rss: int = 0          # bytes, peak of the whole process so far (cumulative over the stages)
+        self.process_peak_rss_children: int = 0 # bytes, the same of the children which finished
+        self.lock: threading.Lock = threading.Lock()
+
+    def start(self) -> None:
+        self.start_time = time.perf_counter()
+        self.rss_start = get_rss()
+        with active_lock:
+            # the stages which are still running keep the peak reached so far
+            peak: int = get_current_peak_rss()
+            process_peak[0] = max(process_peak[0], peak)
+            for stage in active_stages:
+                stage.peak_rss = max(stage.peak_rss, peak)
+            reset_peak_rss()
+            active_stages.add(self)
+            self.peak_rss = max(self.peak_rss, get_current_peak_rss())
+
+    def stop(self) -> None:
+        self.end_time = time.perf_counter()
+        self.wall_time += self.end_time - self.start_time
+        with active_lock:
+            self.peak_rss = max(self.peak_rss, get_current_peak_rss())
+            active_stages.discard(self)
+            process_peak[0] = max(process_peak[0], self.peak_rss)
+            self.process_peak_rss = process_peak[0]
+        self.rss_end = get_rss()
+        self.rss_delta += self.rss_end - self.rss_start
+        self.process_peak_rss_children = get_peak_rss()[1]
+
+    def add_item(self, seconds: float) -> None:
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.) + seconds
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def item(self):
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_item(time.perf_counter() - start)
+
+    @contextmanager
+    def phase(self, name: str):
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def report(self) -> dict:
+        latencies: [float] = sorted(self.latencies)
+        items: int = len(latencies)
+        return {
+            'wall_time': self.wall_time,
+            'items': items,
+            'items_per_second': items / self.wall_time if self.wall_time > 0 else -1.0,
+            'latency': {
+                'mean': sum(latencies) / items if items > 0 else -1.0,
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': latencies[-1] if items > 0 else -1.0,
+            },
+            'phases': dict(self.phases),
+            'counters': dict(self.counters),
+            'peak_rss_mb': self.peak_rss / 1024 / 1024,
+            'rss_start_mb': self.rss_start / 1024 / 1024,
+            'rss_end_mb': self.rss_end / 1024 / 1024,
+            'rss_delta_mb': self.rss_delta / 1024 / 1024,
+            'process_peak_rss_mb': self.process_peak_rss / 1024 / 1024,
+            'process_peak_rss_children_mb': self.process_peak_rss_children / 1024 / 1024,
+        }
+
+class Metrics(object):
+    def __init__(self) -> None:
+        self.stages: Dict[str, StageMetrics] = {}
+        self.reports: Dict[str, dict] = {}  # finished stages of other processes
+        self.lock: threading.Lock = threading.Lock()
+
+    def stage(self, name: str) -> StageMetrics:
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = StageMetrics(name)
+            return self.stages[name]
+
+    @contextmanager
+    def measure(self, name: str):
+        stage: StageMetrics = self.stage(name)
+        stage.start()
+        try:
+            yield stage
+        finally:
+            stage.stop()
+
+    def add_report(self, name: str, report: dict) -> None:
+        self.reports[name] = report
+
+    def report(self) -> dict:
+        stages: Dict[str, dict] = dict(self.reports)
+        for name, stage in self.stages.items():
+            stages[name] = stage.report()
+        return {
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'argv': sys.argv,
+            'stages': stages,
+        }
+
+    def save(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(str(path), 'w') as f:
+            f.write(json.dumps(self.report(), indent=4))
+            f.write('\n')
+        print('created:\t' + str(path))
+
+# Metrics of this process
+metrics: Metrics = Metrics()
+
+
+def percentile(values: [float], percent: float) -> float:
+    if len(values) == 0:
+        return -1.0
+    # nearest rank
+    index: int = min(len(values), max(1, math.ceil(percent / 100. * len(values)))) - 1
+    return values[index]
+
+# The running stages, a stage resets the peak of the process when it starts (so its peak is its own)
+active_stages: set = set()
+active_lock: threading.Lock = threading.Lock()
+# Peak of the process over all resets (bytes)
+process_peak: [int] = [0]
+
+# Resets the peak RSS (VmHWM) of the process to its current RSS, not possible without /proc (or a kernel before 4.0):
+# the peak of a stage is then the peak of the process up to its end
+def reset_peak_rss() -> None:
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+# Peak RSS of the process in bytes since the last reset_peak_rss
+def get_current_peak_rss() -> int:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return get_peak_rss()[0]
+
+# Current RSS of the process in bytes, 0 where there is no /proc
+def get_rss() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+# (self, children) in bytes, the high-water marks of getrusage (the one of the process is reset by reset_peak_rss)
+def get_peak_rss() -> (int, int):
+    if resource is None:
+        return (0, 0)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit: int = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)
+
+# Current RSS of the descendant processes in bytes (only the ones running an executable in 'executable_dir' if given),
+# 0 where there is no /proc (a peak can't tell if a restart freed memory)
+def get_children_rss(executable_dir: str = None) -> int:
+    proc: Path = Path('/proc')
+    if not proc.exists():
+        return 0
+    parents: Dict[int, int] = {}
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            # the name (2nd field) may contain spaces
+            stat: str = entry.joinpath('stat').read_text()
+            parents[int(entry.name)] = int(stat[stat.rindex(')') + 2:].split()[1])
+        except (OSError, ValueError):
+            continue
+
+    descendants: set = {os.getpid()}
+    added: bool = True
+    while added:
+        added = False
+        for pid, parent in parents.items():
+            if parent in descendants and pid not in descendants:
+                descendants.add(pid)
+                added = True
+    descendants.discard(os.getpid())
+
+    rss: int = 0
+    for pid in descendants:
+        try:
+            if executable_dir is not None and not os.readlink('/proc/%d/exe' % pid).startswith(executable_dir):
+                continue
+            with open('/proc/%d/status' % pid) as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss += int(line.split()[1]) * 1024
+                        break
+        except (OSError, ValueError):
+            continue
+    return rss
@@ -0,0 +1,104 @@
+# Profiling of the pipeline stages (--profile of main.py and the stage CLIs).
+# Per stage it writes to the profile folder:
+#   '<stage>.collapsed': sampled stacks of every thread, one 'frame;frame;... count' per line (flamegraph.pl, speedscope, ...)
+#   '<stage>.prof': cProfile dump of the thread running the stage (pstats, snakeviz, ...), only in the 'cprofile' mode
+# The CEF callbacks (OnPaint, OnLoadEnd, save_data_txt) run inside cef.MessageLoop() on the rendering thread and are part of both.
+# Sampling with a low rate is cheap enough to stay enabled, the deterministic cProfile is not.
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict
+import cProfile
+import sys
+import threading
+
+modes: [str] = ['sample', 'cprofile']
+
+class Sampler(threading.Thread):
+    def __init__(self, rate: float) -> None:
+        super().__init__(name='profiling-sampler', daemon=True)
+        self.interval: float = 1. / rate
+        self.stacks: Dict[str, int] = {}
+        self.stopped: threading.Event = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        names: Dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self.ident:
+                continue
+            stack: [str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%d)' % (code.co_name, Path(code.co_filename).name, code.co_firstlineno))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            key: str = ';'.join(reversed(stack)).replace('\n', ' ')
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+
+    def save(self, path: str) -> None:
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(stack + ' ' + str(count) + '\n')
+
+class Profiler(object):
+    def __init__(self) -> None:
+        self.out_path: Path = None
+        self.mode: str = 'sample'
+        self.rate: float = 100.
+        self.active: str = ''
+
+    # out_path: folder of the profiles (None disables profiling), rate: samples per second
+    def configure(self, out_path: str, mode: str = 'sample', rate: float = 100.) -> None:
+        if out_path is None:
+            self.out_path = None
+            return
+        if mode not in modes:
+            raise ValueError('unknown profiling mode: ' + mode)
+        self.out_path = Path(out_path).absolute()
+        self.mode = mode
+        self.rate = rate
+
+    def configuration(self) -> (str, str, float):
+        return (str(self.out_path) if self.out_path is not None else None, self.mode, self.rate)
+
+    @contextmanager
+    def profile(self, name: str):
+        # Not configured or already inside of a profiled stage (e.g. render_html() called by main.py)
+        if self.out_path is None or self.active:
+            yield
+            return
+
+        self.out_path.mkdir(parents=True, exist_ok=True)
+        self.active = name
+        sampler: Sampler = None
+        if self.rate > 0:
+            sampler = Sampler(self.rate)
+            sampler.start()
+        profile: cProfile.Profile = None
+        if self.mode == 'cprofile':
+            profile = cProfile.Profile()
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            if sampler is not None:
+                sampler.stop()
+            if profile is not None:
+                profile.dump_stats(str(self.out_path.joinpath(name + '.prof')))
+                print('created:\t' + str(self.out_path.joinpath(name + '.prof')))
+            if sampler is not None:
+                sampler.save(str(self.out_path.joinpath(name + '.collapsed')))
+                print('created:\t' + str(self.out_path.joinpath(name + '.collapsed')))
+            self.active = ''
+
+# Profiler of this process
+profiler: Profiler = Profiler()
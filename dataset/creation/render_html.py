@@ -2,16 +2,43 @@ from optparse import OptionParser
 from cefpython3 import cefpython as cef
 from pathlib import Path
 import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('../..')))
 from PIL import Image
-from typing import Dict, Tuple
+from typing import Callable, Dict, Iterable, Iterator, Tuple
+from collections import deque
 import re
 import codecs
 import progressbar
 import traceback
 import time
-
-input_dir: str = ''
-output_dir: str = ''
+from dataset.creation.metrics import metrics, StageMetrics, get_children_rss
+from dataset.creation.profiling import profiler
+from dataset.creation.manifest import Manifest, has_manifest, get_document_id
+
+mediator = None
+# word\t(left,top,width,height) of get_data_txt
+box_regex = re.compile(r'^(.*\t)\((-?\d+),(-?\d+),(-?\d+),(-?\d+)\)$')
+# Swap mode: the grid of a generated document (the script is part of the host page)
+body_regex = re.compile(r'<body>(.*)<script', re.DOTALL)
+host_name: str = 'host.html'
+# Font and images of a generated document (cache locality of consecutive documents)
+font_family_regex = re.compile(r'font-family: ([^;"]+);')
+font_size_regex = re.compile(r'font-size: ([^;"]+);')
+image_regex = re.compile(r'<img[^>]* src=["\']?([^"\' >]+)')
+# The generation metadata (see Generator.attributes) the documents are ordered by
+order_attributes: [str] = ['font_family', 'font_size', 'images']
+# Watchdog: timeouts and restarts are logged to the console and to out_dir/render.log
+log_name: str = 'render.log'
+# The RSS of the CEF processes (executables of the cefpython3 package) is checked every rss_interval documents
+rss_interval: int = 10
+cef_dir: str = str(Path(cef.__file__).parent.absolute())
+# Yielded by documents while the next document is not ready yet (e.g. the generator is behind),
+# the next document is requested again after wait_interval ms, the message loop (and the watchdog) keeps running meanwhile
+pending_document: object = object()
+wait_interval: int = 10
+# Offset of a clipped image in the first line of the boxes
+offset_regex = re.compile(r'\toffset=(-?\d+),(-?\d+)$')
+host_html: str = '<!DOCTYPE html><html><head><meta charset="utf-8"><base href=""><link rel="stylesheet" href="%s"></head><body></body><script type="text/javascript" src="%s"></script></html>'
 
 # Main function
 def main() -> None:
@@ -24,70 +51,513 @@ def main() -> None:
                 '--out',
                 dest = 'out_path',
                 metavar = 'FILE' )
+    parser.add_option( '--clip',
+                    dest = 'clip',
+                    action = 'store_true',
+                    default = False)
+    parser.add_option( '--grayscale',
+                    dest = 'grayscale',
+                    action = 'store_true',
+                    default = False)
+    parser.add_option( '--swap',
+                    dest = 'swap',
+                    action = 'store_true',
+                    default = False)
+    parser.add_option( '--order',
+                    dest = 'order',
+                    action = 'store_true',
+                    default = False)
+    parser.add_option( '--page-timeout',
+                    dest = 'page_timeout',
+                    type = 'float',
+                    default = 60.,
+                    metavar = 'SECONDS')
+    parser.add_option( '--page-retries',
+                    dest = 'page_retries',
+                    type = 'int',
+                    default = 1)
+    parser.add_option( '--restart-every',
+                    dest = 'restart_every',
+                    type = 'int',
+                    metavar = 'DOCUMENTS')
+    parser.add_option( '--max-rss',
+                    dest = 'max_rss',
+                    type = 'int',
+                    metavar = 'MB')
+    parser.add_option( '--resume',
+                    dest = 'resume',
+                    action = 'store_true',
+                    default = False)
+    parser.add_option( '--scales',
+                    dest = 'scales',
+                    default = '1',
+                    metavar = 'SCALE,SCALE,...')
+    parser.add_option( '--profile',
+                    dest = 'profile',
+                    metavar = 'FOLDER')
+    parser.add_option( '--profile-mode',
+                    dest = 'profile_mode',
+                    choices = ['sample', 'cprofile'],
+                    default = 'sample')
+    parser.add_option( '--profile-rate',
+                    dest = 'profile_rate',
+                    type = 'float',
+                    default = 100.,
+                    metavar = 'HZ')
     (options, _) = parser.parse_args()
 
-    render_html(options.in_path, options.out_path)
-
-def render_html(in_path: str, out_path: str) -> None:
+    profiler.configure(options.profile, options.profile_mode, options.profile_rate)
+    with profiler.profile('render'):
+        render_html(options.in_path, options.out_path, clip=options.clip, grayscale=options.grayscale, swap=options.swap, order=options.order,
+                    page_timeout=options.page_timeout, page_retries=options.page_retries, restart_every=options.restart_every, max_rss=options.max_rss, resume=options.resume,
+                    scales=[float(scale) for scale in options.scales.split(',')])
+
+# documents: html files to render instead of every html file in in_path (e.g. while they are generated),
+#   or (path relative to in_path without suffix, html) of documents generated in memory, pending_document if the next one is not ready yet
+# on_rendered: is called with the output path (without suffix) after the image and the boxes are saved
+# total: (estimated) number of documents for the progress bar
+# clip: only save the union of the grid cells holding text, the boxes are moved by its offset (recorded after the url in the first line)
+# grayscale: save a grayscale image (fast compression), the recognizers convert to grayscale anyway
+# swap: load a host page once and swap the grid of every document into it instead of navigating to every document
+# order: render the documents of in_path grouped by font family, font size and images, every font is warmed up before its group
+# page_timeout: seconds a document may take (None or 0: no timeout), a stuck document is logged, requeued after the others (up to page_retries times)
+#   and the browser is restarted, documents which time out too often get the status 'timed_out' in the manifest of out_path
+# restart_every: restart the browser (and its render process) after this many documents
+# max_rss: restart the browser once the CEF processes use more than this many MB
+# resume: skip the documents which are already rendered (by the manifest of out_path), e.g. after a crash
+# scales: device scale factors every document is captured with (after one load and layout, with the boxes scaled),
+#   the first one is saved to out_path, every other one to the parallel tree out_path + '_x' + scale (e.g. 'dataset_x2')
+def render_html(in_path: str, out_path: str, documents: Iterable[str] = None, on_rendered: Callable[[str], None] = None, total: int = None, clip: bool = False, grayscale: bool = False, swap: bool = False, order: bool = False, page_timeout: float = 60., page_retries: int = 1, restart_every: int = None, max_rss: int = None, resume: bool = False, scales: [float] = None) -> None:
     cef_handle = CefHandle()
-    cef_handle.run_cef(in_path, out_path)
+    cef_handle.run_cef(in_path, out_path, documents, on_rendered, total, clip, grayscale, swap, order, page_timeout, page_retries, restart_every, max_rss, resume, scales)
+
+# Lazily yields the html files of in_path: from the manifest of the generator if there is one, else by walking the tree
+# order: by the generation metadata in the manifest (else by the font family and size in the paths)
+def get_documents(in_path: str, order: bool = False) -> (Iterator[str], int):
+    if not has_manifest(in_path):
+        if order:
+            # content_variant/font_family/font_size/...
+            paths: [Path] = sorted(Path(in_path).rglob('*.html'), key=lambda path: (path.relative_to(in_path).parts[1:3], str(path)))
+            return (str(path) for path in paths), len(paths)
+        return (str(path) for path in Path(in_path).rglob('*.html')), None
+    html_manifest: Manifest = Manifest(in_path)
+    total: int = html_manifest.count('generated')
+
+    def documents() -> Iterator[str]:
+        for path in html_manifest.paths('generated', order_attributes if order else None):
+            yield str(Path(in_path).joinpath(path + '.html'))
+        html_manifest.close()
+    return documents(), total
 
 class Mediator(object):
-    def __init__(self, browser: cef.PyBrowser, in_path: str, out_path: str) -> None:
+    # open_browser: creates a browser whose callbacks go to the mediator
+    def __init__(self, open_browser: Callable[[], cef.PyBrowser], in_path: str, out_path: str, documents: Iterable[str] = None, on_rendered: Callable[[str], None] = None, total: int = None, clip: bool = False, grayscale: bool = False, swap: bool = False, order: bool = False, page_timeout: float = 60., page_retries: int = 1, restart_every: int = None, max_rss: int = None, resume: bool = False, scales: [float] = None) -> None:
         self.loaded: bool = False
         self.painted: bool = False
+        self.image_saved: bool = False
+        self.data_saved: bool = False
         self.viewport_size: Tuple[int, int] = (1024, 768) # (1100, 800)
-        self.browser: cef.PyBrowser = browser
+        self.open_browser: Callable[[], cef.PyBrowser] = open_browser
+        self.browser: cef.PyBrowser = None
         self.buffer: str = ''
-        self.in_dir: str = in_path
-        self.out_dir: str = out_path
-        self.current_file: str = ''
+        self.in_dir: str = str(Path(in_path).absolute())
+        self.out_dir: str = str(Path(out_path).absolute())
+        self.current_file: str = ''     # relative to in_dir and out_dir, without suffix
+        self.current_out: str = ''      # output path, without suffix
+        self.current_url: str = ''
         Path(self.out_dir).mkdir(parents=True, exist_ok=True)
-        self.urls: [str] = ['']
-
-        for path in Path(self.in_dir).rglob('*.html'):
-            self.urls.append('file://' + str(Path(path).absolute()))
-        self.urls.pop(0)
-        self.bar = progressbar.ProgressBar(max_value=len(self.urls))
+        self.on_rendered: Callable[[str], None] = on_rendered
+        self.clip: bool = clip
+        self.clip_box: Tuple[int, int, int, int] = None     # (left, top, right, bottom) of the current document
+        self.grayscale: bool = grayscale
+        self.swap: bool = swap
+        self.host_loaded: bool = False
+        self.current_html: str = None   # html of the current document
+        self.in_memory: bool = False    # the current document was generated in memory
+        self.order: bool = order
+        self.font: Tuple[str, str] = None       # (font family, font size) of the current document
+        self.images: frozenset = None           # images of the current document
+
+        # Device scale factors: the tree of every scale (the first one is out_dir), the browser keeps its scale between documents
+        self.scales: [float] = scales if scales is not None and len(scales) > 0 else [1.]
+        self.trees: Dict[float, str] = {scale: self.out_dir if i == 0 else self.out_dir + '_x%g' % scale for i, scale in enumerate(self.scales)}
+        self.scale: float = self.scales[0]
+        self.pending_scales: [float] = []    # still to capture of the current document, the current scale first
+        self.scale_start: float = 0.
+
+        # Rendered documents and their ids, committed after every document so a crashed run resumes exactly where it stopped
+        self.manifest: Manifest = Manifest(self.out_dir, batch=1)
+        self.scale_manifests: [Manifest] = [Manifest(tree, batch=1) for tree in list(self.trees.values())[1:]]
+        self.done: frozenset = self.get_done() if resume else frozenset()
+
+        # Watchdog
+        self.page_timeout: float = page_timeout
+        self.page_retries: int = page_retries
+        self.restart_every: int = restart_every
+        self.max_rss: int = max_rss
+        self.current_document = None
+        self.attempts: int = 0          # earlier attempts of the current document
+        self.retries: deque = deque()   # (document, attempts) of the documents which timed out
+        self.sequence: int = 0          # of the current document, the watchdog of an earlier one is ignored
+        self.pages: int = 0             # rendered by the current browser
+
+        # The documents are consumed one after another, rendering starts with the first one
+        if documents is None:
+            documents, total = get_documents(self.in_dir, order)
+        self.bar = progressbar.ProgressBar(max_value=total if total is not None else progressbar.UnknownLength)
+        self.documents: Iterator = iter(documents)
         self.count: int = 0
+        self.waiting: bool = False      # for the next document (pending_document)
+
+        # Timestamps of the current document (warm_up: font of a new group, load: LoadUrl -> OnLoadEnd, paint: OnLoadEnd -> painted frame, encode: PNG)
+        self.stage: StageMetrics = metrics.stage('render')
+        self.load_start: float = 0.
+        self.load_end: float = 0.
+        self.warm_up_start: float = 0.
 
-        global input_dir
-        input_dir = self.in_dir
-        global output_dir
-        output_dir = self.out_dir
+        global mediator
+        mediator = self
 
     def get_current_url(self) -> str:
-        return self.urls[self.count]
+        return self.current_url
+
+    # Opens a browser and loads the first document (the host page in swap mode), returns False if there is no document left
+    def start(self) -> bool:
+        self.browser = self.open_browser()
+        self.pages = 0
+        self.host_loaded = False
+        # the caches of a new browser are cold
+        self.font = None
+        self.images = None
+        if self.swap:
+            self.load_host()
+            return True
+        return self.next_url()
+
+    # Returns False if there is no document left
+    def next_url(self) -> bool:
+        document = self.next_document()
+        if document is None:
+            return False
+        self.waiting = document is pending_document
+        if self.waiting:
+            self.stage.count('waits')
+            cef.PostDelayedTask(cef.TID_UI, wait_interval, next_url)
+            return True
+        self.current_document = document
+        path, html = self.resolve(document)
+        self.in_memory = html is not None
+        self.current_url = 'file://' + path
+        # in_dir/<current_file>.html -> out_dir/<current_file>.png/.txt
+        self.current_file = path[len(self.in_dir) + 1:-len('.html')]
+        self.current_out = str(Path(self.out_dir).joinpath(self.current_file))
+        for scale in self.scales:
+            Path(self.get_out(scale)).parent.mkdir(parents=True, exist_ok=True)
+        self.pending_scales = [self.scale] + [scale for scale in self.scales if scale != self.scale]
+        if self.in_memory:
+            self.current_html = html
+        else:
+            with codecs.open(path, 'r', 'utf-8-sig') as f:
+                self.current_html = f.read()
+        self.watch()
+
+        font: Tuple[str, str] = get_font(self.current_html)
+        # relative to misc/imgs (the documents are in different depths)
+        images: frozenset = frozenset(image.split('imgs/')[-1] for image in image_regex.findall(self.current_html))
+        self.count_transition(font, images)
+        previous_font: Tuple[str, str] = self.font
+        self.font = font
+        self.images = images
+        # A page is loaded (the previous document or the host page) to warm up the font in, font_ready loads the document
+        if self.order and font is not None and font != previous_font and (previous_font is not None or self.swap):
+            self.warm_up_start = time.perf_counter()
+            self.browser.ExecuteFunction('warm_up_font', font[0], font[1], self.sequence)
+            return True
+        self.load_document()
+        return True
 
-    def next_url(self) -> None:
-        if self.count < len(self.urls):
+    # The documents in order, then the ones which timed out, the rendered ones are skipped (resume)
+    def next_document(self):
+        for document in self.documents:
+            if document is pending_document:
+                return document
+            if len(self.done) > 0:
+                path, _ = self.resolve(document)
+                current_file: str = path[len(self.in_dir) + 1:-len('.html')]
+                if current_file in self.done:
+                    self.skip(current_file)
+                    continue
+            self.attempts = 0
+            return document
+        if len(self.retries) > 0:
+            document, self.attempts = self.retries.popleft()
+            return document
+        return None
+
+    # (absolute path, None) of an html file or (the path it would have as a file, html) of a document generated in memory
+    # (its images and the style are relative to it)
+    def resolve(self, document) -> (str, str):
+        if isinstance(document, tuple):
+            return str(Path(self.in_dir).joinpath(document[0])) + '.html', document[1]
+        if document.startswith('file://'):
+            document = document[len('file://'):]
+        return str(Path(document).absolute()), None
+
+    # The documents rendered in every tree: in its manifest or (not committed yet) with its image and boxes in the tree
+    def get_done(self) -> frozenset:
+        done: set = set(self.manifest.paths('rendered'))
+        for scale, scale_manifest in zip(self.scales[1:], self.scale_manifests):
+            rendered: set = set(scale_manifest.paths('rendered'))
+            tree: Path = Path(self.trees[scale])
+            done = {path for path in done if path in rendered or (tree.joinpath(path + '.png').exists() and tree.joinpath(path + '.txt').exists())}
+        return frozenset(done)
+
+    # A document rendered by an earlier run counts as rendered (on_rendered is called as well, e.g. to archive it again)
+    def skip(self, current_file: str) -> None:
+        self.stage.count('resumed')
+        for scale_manifest in self.scale_manifests:
+            scale_manifest.add(current_file, self.manifest.get_id(current_file), 'rendered')
+        self.count += 1
+        self.bar.update(self.count if self.bar.max_value is progressbar.UnknownLength else min(self.count, self.bar.max_value))
+        if self.on_rendered is not None:
+            self.on_rendered(str(Path(self.out_dir).joinpath(current_file)))
+
+    # The bindings pass the sequence number of the document they were called for,
+    # a late call for an earlier document (e.g. of a closed browser after a timeout) is dropped
+    # The script.js of an html tree generated before the sequence numbers passes none, its calls count for the current document
+    def is_current(self, sequence: int) -> bool:
+        if sequence is None or sequence == self.sequence:
+            return True
+        self.stage.count('stale_callbacks')
+        return False
+
+    # Arms the watchdog of the current document
+    def watch(self) -> None:
+        self.sequence += 1
+        if self.page_timeout is not None and self.page_timeout > 0:
+            cef.PostDelayedTask(cef.TID_UI, int(self.page_timeout * 1000), watchdog, self.sequence)
+
+    # The document with the sequence number did not finish in time (called by the watchdog)
+    def check_timeout(self, sequence: int) -> None:
+        if sequence != self.sequence:
+            return
+        step: str = 'load' if not self.loaded else 'paint' if not self.painted else 'boxes' if not self.data_saved else 'image'
+        self.stage.count('timeouts')
+        if self.attempts < self.page_retries:
+            self.retries.append((self.current_document, self.attempts + 1))
+            self.log('timeout:\t' + self.current_file + ' (' + step + ', requeued)')
+        else:
+            self.manifest.set_status(self.current_file, 'timed_out')
+            self.stage.count('timed_out')
+            self.log('timeout:\t' + self.current_file + ' (' + step + ', given up)')
+        self.painted = False
+        self.loaded = False
+        self.image_saved = False
+        self.data_saved = False
+        # the render process may hang
+        self.restart_browser()
+
+    # Every restart_every documents, and if the CEF processes use more than max_rss (checked every rss_interval documents)
+    def needs_restart(self) -> bool:
+        if self.restart_every is not None and self.pages >= self.restart_every:
+            return True
+        if self.max_rss is not None and self.pages % rss_interval == 0:
+            rss: int = get_children_rss(cef_dir)
+            if rss > self.max_rss * 1024 * 1024:
+                self.log('restart:\tCEF uses ' + str(rss // (1024 * 1024)) + ' MB after ' + str(self.pages) + ' documents')
+                return True
+        return False
+
+    # Replaces the browser (and its render process), rendering continues with the next document
+    def restart_browser(self) -> None:
+        self.stage.count('restarts')
+        self.browser.CloseBrowser(True)
+        if not self.start():
+            exit_app()
+
+    # Console and out_dir/render.log
+    def log(self, message: str) -> None:
+        print('\n' + message)
+        with codecs.open(str(Path(self.out_dir).joinpath(log_name)), 'a', 'utf-8') as f:
+            f.write('[%s] %s\n' % (time.strftime('%Y-%m-%d %H:%M:%S'), message))
+
+    def load_document(self) -> None:
+        self.load_start = time.perf_counter()
+        if self.swap:
+            match = body_regex.search(self.current_html)
+            self.browser.ExecuteFunction('swap_document', self.current_url, match.group(1) if match is not None else '', self.sequence)
+        elif self.in_memory:
             self.browser.StopLoad()
-            reg_ex = '(?<='+ self.in_dir + ').*'
-            self.current_file = re.search(re.compile(reg_ex), self.urls[self.count]).group()[:-5]
-            self.browser.LoadUrl(self.urls[self.count])
-            self.browser.WasResized()
-
-    def save_image(self) -> bool:
-        if self.painted and self.loaded:
+            self.browser.GetMainFrame().LoadString(self.current_html, self.current_url)
+        else:
+            self.browser.StopLoad()
+            self.browser.LoadUrl(self.current_url)
+        self.browser.WasResized()
+
+    # The font is rendered once in the loaded page (called by warm_up_font)
+    def font_ready(self) -> None:
+        self.stage.add_phase('warm_up', time.perf_counter() - self.warm_up_start)
+        self.stage.count('warm_ups')
+        self.load_document()
+
+    # A transition to the next document is cache friendly if its font (family and size) stays the same
+    # and all of its images were used by the previous document
+    def count_transition(self, font: Tuple[str, str], images: frozenset) -> None:
+        if self.images is None:
+            return
+        if font == self.font and images <= self.images:
+            self.stage.count('transitions_warm')
+        else:
+            self.stage.count('transitions_cold')
+            if font != self.font:
+                self.stage.count('font_switches')
+            if not images <= self.images:
+                self.stage.count('image_switches')
+
+    # Swap mode: the host page links the style and the script of the documents, relative urls are resolved by its <base>
+    def load_host(self) -> None:
+        resources: Path = Path(__file__).parent.absolute().joinpath('resources')
+        host_path: Path = Path(self.in_dir).joinpath('misc', host_name)
+        host_path.parent.mkdir(parents=True, exist_ok=True)
+        with codecs.open(str(host_path), 'w', 'utf-8') as f:
+            f.write(host_html % (resources.joinpath('style.css').as_uri(), resources.joinpath('script.js').as_uri()))
+        self.browser.LoadUrl(host_path.as_uri())
+
+    # Swap mode: the grid is swapped in, its images are loaded and its fonts are ready (called by swap_document)
+    def document_ready(self) -> None:
+        self.load_end = time.perf_counter()
+        self.stage.add_phase('load', self.load_end - self.load_start)
+        # only a frame painted after the swap counts
+        self.painted = False
+        self.loaded = True
+        self.browser.ExecuteFunction('get_data_txt', self.sequence)
+        self.browser.Invalidate(cef.PET_VIEW)
+
+    # Clipping needs the cells of the boxes (save_data_txt) before the image can be saved
+    # With several scales the image of every scale is saved before the document is finished
+    def save_image(self) -> None:
+        if self.painted and self.loaded and not self.image_saved and (self.data_saved or not self.clip):
+            size: Tuple[int, int] = self.browser.GetUserData('OnPaint.size')
+            # a frame painted before the scale changed (CEF may round the size of a fractional scale differently)
+            expected: Tuple[int, int] = self.get_size(self.scale)
+            if abs(size[0] - expected[0]) > 1 or abs(size[1] - expected[1]) > 1:
+                return
+            encode_start: float = time.perf_counter()
+            if len(self.pending_scales) < len(self.scales):
+                self.stage.add_phase('rescale', encode_start - self.scale_start)
+            else:
+                self.stage.add_phase('paint', encode_start - self.load_end)
             buffer_string = self.browser.GetUserData('OnPaint.buffer_string')
-            rgba_image = Image.frombytes('RGBA', self.viewport_size, buffer_string, 'raw', 'RGBA', 0, 1)
-            rgb_image = rgba_image.convert('RGB')
+            rgba_image = Image.frombytes('RGBA', size, buffer_string, 'raw', 'RGBA', 0, 1)
+            if self.clip:
+                rgba_image = rgba_image.crop(tuple(min(int(round(e * self.scale)), size[i % 2]) for i, e in enumerate(self.clip_box)))
             # Save image
-            real_out_dir: str = re.search(r'(.*[\/])', self.out_dir + self.current_file).group()
-            Path(real_out_dir).mkdir(parents=True, exist_ok=True)
-            rgb_image.save(self.out_dir + self.current_file + '.png', 'PNG', dpi=(self.viewport_size[0], self.viewport_size[1]))
+            out_path: str = self.get_out(self.scale) + '.png'
+            if self.grayscale:
+                rgba_image.convert('L').save(out_path, 'PNG', dpi=size, compress_level=1)
+            else:
+                rgba_image.convert('RGB').save(out_path, 'PNG', dpi=size)
+            self.stage.add_phase('encode', time.perf_counter() - encode_start)
+            self.pending_scales.pop(0)
+            if len(self.pending_scales) > 0:
+                self.set_scale(self.pending_scales[0])
+                return
+            self.image_saved = True
+            self.finish()
+
+    # The page is painted again with another device scale factor (without a new layout)
+    def set_scale(self, scale: float) -> None:
+        self.scale_start = time.perf_counter()
+        self.scale = scale
+        self.painted = False
+        self.stage.count('rescales')
+        self.browser.NotifyScreenInfoChanged()
+        self.browser.WasResized()
+        self.browser.Invalidate(cef.PET_VIEW)
+
+    # Size of the painted frames in pixels
+    def get_size(self, scale: float) -> Tuple[int, int]:
+        return (int(round(self.viewport_size[0] * scale)), int(round(self.viewport_size[1] * scale)))
+
+    # Output path of the current document in the tree of the scale, without suffix
+    def get_out(self, scale: float) -> str:
+        return str(Path(self.trees[scale]).joinpath(self.current_file))
+
+    # Boxes (and the offset of a clipped image) in the pixels of the scale
+    def scale_data(self, value: str, scale: float) -> str:
+        if scale == 1:
+            return value
+        lines: [str] = value.split('\n')
+        match = offset_regex.search(lines[0])
+        if match is not None:
+            lines[0] = lines[0][:match.start()] + '\toffset=' + str(int(round(int(match.group(1)) * scale))) + ',' + str(int(round(int(match.group(2)) * scale)))
+        for i in range(1, len(lines)):
+            match = box_regex.match(lines[i])
+            if match is None:
+                continue
+            groups = match.groups()
+            lines[i] = groups[0] + '(' + ','.join([str(int(round(int(e) * scale))) for e in groups[1:5]]) + ')'
+        return '\n'.join(lines)
+
+    # The next document is loaded once the image and the boxes (save_data_txt) of the current one are saved
+    def finish(self) -> None:
+        if self.image_saved and self.data_saved:
             self.painted = False
             self.loaded = False
-            self.bar.update(self.count)
+            self.image_saved = False
+            self.data_saved = False
+            # disarms the watchdog
+            self.sequence += 1
+            self.stage.add_item(time.perf_counter() - self.load_start)
+            self.manifest.add(self.current_file, self.get_document_id(), 'rendered')
+            for scale_manifest in self.scale_manifests:
+                scale_manifest.add(self.current_file, self.get_document_id(), 'rendered')
             self.count += 1
-            if self.count >= len(self.urls):
+            self.pages += 1
+            self.bar.update(self.count if self.bar.max_value is progressbar.UnknownLength else min(self.count, self.bar.max_value))
+            if self.on_rendered is not None:
+                self.on_rendered(self.current_out)
+            if self.needs_restart():
+                # not within a callback of the browser which is closed
+                cef.PostTask(cef.TID_UI, restart_browser)
+            elif not self.next_url():
                 exit_app()
-            self.next_url()
+
+    # Moves the boxes into the union of the cells holding text (a single pixel if there is no text)
+    def clip_data(self, value: str, cells: [[int]]) -> str:
+        left: int = max(0, min([cell[0] for cell in cells], default=0))
+        top: int = max(0, min([cell[1] for cell in cells], default=0))
+        right: int = min(self.viewport_size[0], max([cell[0] + cell[2] for cell in cells], default=0))
+        bottom: int = min(self.viewport_size[1], max([cell[1] + cell[3] for cell in cells], default=0))
+        if right <= left or bottom <= top:
+            left, top, right, bottom = 0, 0, 1, 1
+        self.clip_box = (left, top, right, bottom)
+        self.stage.count('clipped_pixels', self.viewport_size[0] * self.viewport_size[1] - (right - left) * (bottom - top))
+
+        lines: [str] = value.split('\n')
+        lines[0] += '\toffset=' + str(left) + ',' + str(top)
+        for i in range(1, len(lines)):
+            match = box_regex.match(lines[i])
+            if match is None:
+                continue
+            groups = match.groups()
+            lines[i] = groups[0] + '(' + str(max(0, int(groups[1]) - left)) + ',' + str(max(0, int(groups[2]) - top)) + ',' + groups[3] + ',' + groups[4] + ')'
+        return '\n'.join(lines)
+
+    # Same id as in the manifest of the generator (the hash of the html)
+    def get_document_id(self) -> str:
+        return get_document_id(self.current_html)
+
+    def close(self) -> None:
+        self.bar.finish()
+        self.manifest.close()
+        for scale_manifest in self.scale_manifests:
+            scale_manifest.close()
 
 
 class CefHandle(object):
 
-    def run_cef(self, in_path: str, out_path: str) -> None:
+    def run_cef(self, in_path: str, out_path: str, documents: Iterable[str] = None, on_rendered: Callable[[str], None] = None, total: int = None, clip: bool = False, grayscale: bool = False, swap: bool = False, order: bool = False, page_timeout: float = 60., page_retries: int = 1, restart_every: int = None, max_rss: int = None, resume: bool = False, scales: [float] = None) -> None:
 
         # Setup CEF
         sys.excepthook = customExceptHook  # to shutdown all CEF processes on error
@@ -107,34 +577,42 @@ class CefHandle(object):
         }
         cef.Initialize(settings=settings, switches=switches)
         print()
-        browser = self.create_browser(browser_settings, in_path, out_path)
-
-        bindings = cef.JavascriptBindings()
-        bindings.SetFunction("save_data", save_data_txt)
-        browser.SetJavascriptBindings(bindings)
+        mediator: Mediator = self.create_mediator(browser_settings, in_path, out_path, documents, on_rendered, total, clip, grayscale, swap, order, page_timeout, page_retries, restart_every, max_rss, resume, scales)
 
-        # Enter loop
-        cef.MessageLoop()
+        # Enter loop (only if there is something to render, the host page decides in swap mode)
+        if mediator.current_url or mediator.waiting or mediator.swap:
+            with metrics.measure('render'):
+                cef.MessageLoop()
 
         # Cleanup
-        browser.CloseBrowser()
+        mediator.close()
+        mediator.browser.CloseBrowser()
         cef.Shutdown()
         print('\nDone!')
 
-    # Create a browser
-    def create_browser(self, settings, in_path: str, out_path: str) -> None:
+    # Create the mediator, it opens the (first) browser
+    def create_mediator(self, settings, in_path: str, out_path: str, documents: Iterable[str] = None, on_rendered: Callable[[str], None] = None, total: int = None, clip: bool = False, grayscale: bool = False, swap: bool = False, order: bool = False, page_timeout: float = 60., page_retries: int = 1, restart_every: int = None, max_rss: int = None, resume: bool = False, scales: [float] = None) -> Mediator:
+        mediator: Mediator = Mediator(lambda: self.create_browser(settings), in_path, out_path, documents, on_rendered, total, clip, grayscale, swap, order, page_timeout, page_retries, restart_every, max_rss, resume, scales)
+        mediator.start()
+        return mediator
+
+    # Create a browser (again after a restart), its callbacks go to the mediator
+    def create_browser(self, settings) -> cef.PyBrowser:
 
         parent_window_handle: int = 0
         window_info: cef.WindowInfo = cef.WindowInfo()
         window_info.SetAsOffscreen(parent_window_handle)
         browser: cef.PyBrowser = cef.CreateBrowserSync(window_info=window_info, settings=settings, url='')
-        
-        mediator: Mediator = Mediator(browser, in_path, out_path)
-        mediator.next_url()
 
         browser.SetClientHandler(LoadHandler(mediator))
         browser.SetClientHandler(RenderHandler(mediator))
 
+        bindings = cef.JavascriptBindings()
+        bindings.SetFunction("save_data", save_data_txt)
+        bindings.SetFunction("document_ready", document_ready)
+        bindings.SetFunction("font_ready", font_ready)
+        browser.SetJavascriptBindings(bindings)
+
         browser.SendFocusEvent(True)
         browser.WasResized()
         return browser
@@ -148,15 +626,34 @@ class RenderHandler(object):
         rect_out.extend([0, 0, self.mediator.viewport_size[0], self.mediator.viewport_size[1]])
         return True
 
+    # The view keeps its size, it is painted with more (or less) pixels
+    def GetScreenInfo(self, screen_info_out: dict, **_) -> bool:
+        if self.mediator.scale == 1:
+            return False
+        rect: [int] = [0, 0, self.mediator.viewport_size[0], self.mediator.viewport_size[1]]
+        screen_info_out.update({
+            'device_scale_factor': self.mediator.scale,
+            'depth': 24,
+            'depth_per_component': 8,
+            'is_monochrome': False,
+            'rect': rect,
+            'available_rect': rect,
+        })
+        return True
+
     def OnPaint(self, browser: cef.PyBrowser, element_type, dirty_rects, paint_buffer, width, height) -> None:
         #print('dirty_rects: ')
         #print(dirty_rects)
+        # a closed browser may still paint
+        if browser.GetIdentifier() != self.mediator.browser.GetIdentifier():
+            return
         if element_type == cef.PET_VIEW:
             #print('OnPaint: ' + browser.GetUrl())
             # retrieve the image bytes
             buffer_string: str = paint_buffer.GetBytes(mode='rgba', origin='top-left')
             # initiate the image creation
             browser.SetUserData('OnPaint.buffer_string', buffer_string)
+            browser.SetUserData('OnPaint.size', (width, height))
             self.mediator.painted = True
             self.mediator.save_image()
 
@@ -165,32 +662,74 @@ class LoadHandler(object):
         self.mediator = mediator
 
     def OnLoadEnd(self, browser: cef.PyBrowser, frame: cef.PyFrame, **_):
+            if browser.GetIdentifier() != self.mediator.browser.GetIdentifier():
+                return
+            # Swap mode: only the host page is loaded, the documents are swapped into it from now on
+            if self.mediator.swap:
+                if frame.IsMain() and not self.mediator.host_loaded:
+                    self.mediator.host_loaded = True
+                    if not self.mediator.next_url():
+                        exit_app()
+                return
+
+            self.mediator.load_end = time.perf_counter()
+            self.mediator.stage.add_phase('load', self.mediator.load_end - self.mediator.load_start)
             self.mediator.loaded = True
-            browser.ExecuteFunction("get_data_txt")
+            browser.ExecuteFunction("get_data_txt", self.mediator.sequence)
 
             self.mediator.save_image()
 
-def save_data_txt(value):
-    global input_dir
-    global output_dir
-
-    path: str = value.split('\n')[0][8:]
-
-    term = '\/' + Path(input_dir).name + '\/'
-    reg = '(' + term + ')(.*)'
-    found = re.search(re.compile(reg),path).groups()[1]
-
-
-    # found_list = found.split('/')[0:-1]
-    # found_path = '/'.join(found_list)
-
-    # found_path_name_list = found.split('.')[0:-1]
-    # found_path_name = '/'.join(found_path_name_list)
-
-    out_path = str(Path(output_dir).joinpath(found)).replace(Path(found).suffix, '.txt')
-    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
-    with codecs.open(out_path, 'w', "utf-8") as f:
-        f.write(value)
+def document_ready(sequence: int = None):
+    global mediator
+    if mediator.is_current(sequence):
+        mediator.document_ready()
+
+def font_ready(sequence: int = None):
+    global mediator
+    if mediator.is_current(sequence):
+        mediator.font_ready()
+
+def watchdog(sequence: int):
+    global mediator
+    mediator.check_timeout(sequence)
+
+def restart_browser():
+    global mediator
+    mediator.restart_browser()
+
+def next_url():
+    global mediator
+    if not mediator.next_url():
+        exit_app()
+
+# cells: [left, top, width, height] of the grid cells holding text
+# sequence: of the document the boxes belong to
+def save_data_txt(value, cells=None, sequence=None):
+    global mediator
+    if not mediator.is_current(sequence):
+        return
+
+    if mediator.clip:
+        value = mediator.clip_data(value, cells if cells is not None else [])
+
+    # The boxes belong to the current document (the next one is loaded after they are saved)
+    with mediator.stage.phase('boxes'):
+        for scale in mediator.scales:
+            with codecs.open(mediator.get_out(scale) + '.txt', 'w', "utf-8") as f:
+                f.write(mediator.scale_data(value, scale))
+
+    mediator.data_saved = True
+    # a clipped image waits for the cells
+    mediator.save_image()
+    mediator.finish()
+
+# (font family, font size) of the grid of a document, None if it has no text (images_only)
+def get_font(html: str) -> Tuple[str, str]:
+    family = font_family_regex.search(html)
+    size = font_size_regex.search(html)
+    if family is None or size is None:
+        return None
+    return (family.group(1).strip(), size.group(1).strip())
 
 # Needed to exit the Message Loop without killing the process:
 class FinishedException(Exception):
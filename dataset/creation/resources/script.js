@@ -1,5 +1,8 @@
+// Url of the document in the host page of the swap mode (render_html.py --swap)
+var document_url = null;
+
 // Hide unwanted elements
-(function() {
+function hide_overflowing() {
     let spans = document.getElementsByTagName("span");
     for (i = 0; i < spans.length; i++) {
         if (!spans[i].innerText.match(/^[a-zA-Z0-9]+/)) {
@@ -14,12 +17,62 @@
                 spans[i].setAttribute("style", "display: none;");
         }
     }
-})();
+}
+hide_overflowing();
+
+
+// Swap mode: replaces the grid of the host page by the one of the next document (relative urls are resolved against url),
+// calls the binding document_ready (with the sequence number of the document) once its images are loaded and its fonts are ready
+function swap_document(url, grid, sequence) {
+    document_url = url;
+    document.getElementsByTagName('base')[0].href = url;
+    document.body.innerHTML = grid;
+    let images = Array.prototype.map.call(document.images, function(image) {
+        return image.complete ? Promise.resolve() : new Promise(function(resolve) {
+            image.onload = resolve;
+            image.onerror = resolve;
+        });
+    });
+    Promise.all(images).then(function() {
+        return document.fonts.ready;
+    }).then(function() {
+        hide_overflowing();
+        // after the next frame the document is laid out and painted
+        requestAnimationFrame(function() {
+            requestAnimationFrame(function() {
+                document_ready(sequence);
+            });
+        });
+    });
+}
+
+
+// Order mode (render_html.py --order): loads and lays out the font of the next group of documents once,
+// calls the binding font_ready (with the sequence number of the document) when it is done (or failed)
+function warm_up_font(family, size, sequence) {
+    let sample = document.createElement('span');
+    sample.style.fontFamily = family;
+    sample.style.fontSize = size;
+    sample.style.position = 'absolute';
+    sample.style.visibility = 'hidden';
+    sample.textContent = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz1234567890';
+    document.body.appendChild(sample);
+    sample.getBoundingClientRect();
+    let done = function() {
+        document.body.removeChild(sample);
+        font_ready(sequence);
+    };
+    document.fonts.load(size + ' ' + family, sample.textContent).then(done, done);
+}
 
 
 // word\t(left,top,width,height)\n
-function get_data_txt() {
-    let output = window.location.href + '\n';
+// and the grid cells holding text: [[left,top,width,height], ...]
+// are passed to the binding save_data with the sequence number of the document
+function get_data_txt(sequence) {
+    let output = (document_url !== null ? document_url : window.location.href) + '\n';
+    let cells = [];
+    let cellElements = new Set();
     let spans = document.getElementsByTagName('span');
     for(i = 0; i < spans.length; i++) {
         let spanRect = spans[i].getBoundingClientRect()
@@ -28,8 +81,12 @@ function get_data_txt() {
             spans[i].innerText.match(/^[a-zA-Z0-9]+/)) {
                 let word = spans[i].innerText
                 output += word + '\t(' + Math.round(spanRect.left) + ',' + Math.round(spanRect.top) + ',' + Math.round(spanRect.width) + ',' + Math.round(spanRect.height) + ')\n'
+                if (!cellElements.has(spans[i].parentNode.parentNode)) {
+                    cellElements.add(spans[i].parentNode.parentNode);
+                    cells.push([Math.floor(divRect.left), Math.floor(divRect.top), Math.ceil(divRect.width), Math.ceil(divRect.height)]);
+                }
         }
     }
-    save_data(output);
+    save_data(output, cells, sequence);
     // console.log(output);
 }
@@ -1,86 +1,111 @@
-import numpy as np
+from optparse import OptionParser
 import progressbar
 import codecs
+import csv
+import json
 import re
+import struct
+import tempfile
 from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('../..')))
+from typing import Iterator, List, Tuple
+from dataset.creation.manifest import get_files
 
-def main():
-
-    dataset_path = str(Path('./dataset').resolve())
-
-    # Extract Data
-    print('Extract Data:')
-    data = extract_data(dataset_path)
-    # print(data)
-    # Create CSV
-    print('Convert Data:')
-    to_csv(dataset_path, data)
-
-
-def to_csv(dataset_path, data):
-    width = 1100.0
-    height = 800.0
-
-    csv_string: str = 'filepath,x1,y1,x2,y2,class_name\n'
-    for i in progressbar.progressbar(range(len(data))):
-        img = data[i]
-
-        filename = img[0]
-
-        iter_boxes = iter(img)
-        next(iter_boxes)
-        for box in iter_boxes:
-            csv_string += filename
-            csv_string += ','
-            csv_string += str(box[0]/width)
-            csv_string += ','
-            csv_string += str(box[1]/height)
-            csv_string += ','
-            csv_string += str(box[2]/width)
-            csv_string += ','
-            csv_string += str(box[3]/height)
-            csv_string += ','
-            csv_string += 'text'
-            csv_string += '\n'
-
-    with codecs.open('./labels.csv', 'w', "utf-8") as f:
-        f.write(csv_string)
+# Box = (left, top, width, height)
+Box = Tuple[int, int, int, int]
 
-def extract_data(dataset_path):
-
-    files = []
-    for path in Path(dataset_path).rglob('*.png'):
-        files.append(path)
-
-    all_coordinates = []
-    for i in progressbar.progressbar(range(len(files))):
-        # if i > 10: break
-
-        p = files[i]
-        name = [str(p)]
-
-        # Retrieve Coordinates
-        boxes = name + extract_boxes(p)
-
-        # Save Filename & Coordinates
-        all_coordinates.append(boxes)
-
-    data = np.asarray(all_coordinates)
-    return data
+# Fallback if an image can not be read, same as Mediator.viewport_size
+viewport_size: Tuple[int, int] = (1024, 768)
 
+def main():
+    parser = OptionParser()
+    parser.add_option( '-i',
+                    '--in',
+                    dest = 'in_path',
+                    default = './dataset',
+                    metavar = 'FOLDER' )
+    parser.add_option( '-o',
+                    '--out',
+                    dest = 'out_path',
+                    default = None,
+                    metavar = 'FILE' )
+    parser.add_option( '-f',
+                    '--format',
+                    dest = 'format',
+                    type = 'choice',
+                    choices = ['csv', 'coco'],
+                    default = 'csv' )
+    (options, _) = parser.parse_args()
+
+    dataset_path = str(Path(options.in_path).resolve())
 
-def extract_boxes(filename):
+    print('Convert Data:')
+    if options.format == 'coco':
+        to_coco(dataset_path, options.out_path or './labels.json')
+    else:
+        to_csv(dataset_path, options.out_path or './labels.csv')
+
+
+# One row per box, coordinates are normalized by the size of the rendered image
+def to_csv(dataset_path, out_path='./labels.csv'):
+    with codecs.open(out_path, 'w', 'utf-8', buffering=1 << 20) as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['filepath', 'x1', 'y1', 'x2', 'y2', 'class_name'])
+        for filename, (width, height), boxes in progressbar.progressbar(extract_data(dataset_path)):
+            writer.writerows([
+                    filename,
+                    left / width,
+                    top / height,
+                    (left + box_width) / width,
+                    (top + box_height) / height,
+                    'text'
+                ] for (left, top, box_width, box_height) in boxes)
+
+# One entry per image (COCO style), the annotations are buffered in a temporary file to keep the memory constant
+def to_coco(dataset_path, out_path='./labels.json'):
+    with codecs.open(out_path, 'w', 'utf-8', buffering=1 << 20) as f, tempfile.TemporaryFile('w+', encoding='utf-8') as annotations:
+        f.write('{"categories": [{"id": 1, "name": "text"}],\n"images": [\n')
+        annotation_id: int = 0
+        for image_id, (filename, (width, height), boxes) in enumerate(progressbar.progressbar(extract_data(dataset_path))):
+            if image_id > 0:
+                f.write(',\n')
+            f.write(json.dumps({'id': image_id, 'file_name': filename, 'width': width, 'height': height}))
+            for box in boxes:
+                if annotation_id > 0:
+                    annotations.write(',\n')
+                annotations.write(json.dumps({'id': annotation_id, 'image_id': image_id, 'category_id': 1, 'bbox': list(box), 'area': box[2] * box[3], 'iscrowd': 0}))
+                annotation_id += 1
+        f.write('\n],\n"annotations": [\n')
+        annotations.seek(0)
+        for chunk in iter(lambda: annotations.read(1 << 20), ''):
+            f.write(chunk)
+        f.write('\n]}\n')
+
+# Lazily yields (filepath, (width, height), boxes) for every image
+def extract_data(dataset_path) -> Iterator[Tuple[str, Tuple[int, int], List[Box]]]:
+    for p in get_files(dataset_path, '.png'):
+        yield str(p), get_image_size(p), extract_boxes(p)
+
+def extract_boxes(filename) -> [Box]:
     boxes = []
-    with open(str(filename).replace('.png', '.txt'), 'r') as f:
+    with open(str(Path(filename).with_suffix('.txt')), 'r') as f:
         next(f) # skip file name line
         for l in f:
-            box = []
-            coordinates = re.search(r'([0-9]+),([0-9]+),([0-9]+),([0-9]+)', l).groups()
-            for coordinate in coordinates:
-                box.append(int(float(coordinate)))
-            boxes.append(box)
+            found = re.search(r'([0-9]+),([0-9]+),([0-9]+),([0-9]+)', l)
+            if found is None:
+                continue
+            boxes.append(tuple(int(float(coordinate)) for coordinate in found.groups()))
     return boxes
 
+# Reads width and height from the IHDR chunk without decoding the image
+def get_image_size(filename) -> Tuple[int, int]:
+    with open(str(filename), 'rb') as f:
+        header: bytes = f.read(24)
+    if len(header) < 24 or header[:8] != b'\x89PNG\r\n\x1a\n' or header[12:16] != b'IHDR':
+        return viewport_size
+    return struct.unpack('>II', header[16:24])
+
 
 if __name__ == '__main__':
     main()
@@ -1,8 +1,17 @@
 # Small helper script to zip the dataset if wanted and OS independent.
 from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('../..')))
+from concurrent.futures import ThreadPoolExecutor
 import os
+import time
 import zipfile
 from optparse import OptionParser
+from dataset.creation.metrics import metrics
+from dataset.creation.profiling import profiler
+
+# Already compressed, deflating them only costs time
+stored_suffixes: [str] = ['.png', '.jpg', '.jpeg', '.gif', '.zip', '.gz']
 
 
 def main() -> None:
@@ -10,20 +19,101 @@ def main() -> None:
     parser.add_option( '-i',
                     '--in',
                     dest = 'in_path')
+    parser.add_option( '-w',
+                    '--workers',
+                    dest = 'workers',
+                    type = 'int',
+                    default = 1)
+    parser.add_option( '-s',
+                    '--split',
+                    dest = 'split_size',
+                    type = 'int',
+                    default = 0,
+                    metavar = 'MB')
+    parser.add_option( '--profile',
+                    dest = 'profile',
+                    metavar = 'FOLDER')
+    parser.add_option( '--profile-mode',
+                    dest = 'profile_mode',
+                    choices = ['sample', 'cprofile'],
+                    default = 'sample')
+    parser.add_option( '--profile-rate',
+                    dest = 'profile_rate',
+                    type = 'float',
+                    default = 100.,
+                    metavar = 'HZ')
     (options, _) = parser.parse_args()
 
     in_path: str = str(Path(options.in_path).absolute())
 
-    create_zip(in_path)
+    profiler.configure(options.profile, options.profile_mode, options.profile_rate)
+    with profiler.profile('zip'):
+        create_zip(in_path, options.workers, options.split_size * 1024 * 1024)
+
+# Creates 'in_path.zip' or, if split into shards, 'in_path.001.zip', 'in_path.002.zip', ...
+#   workers: how many shards are written in parallel (without split_size the files are spread evenly over the workers)
+#   split_size: maximal size of the uncompressed files in one shard in bytes (0: no limit)
+def create_zip(in_path: str, workers: int = 1, split_size: int = 0) -> [str]:
+    in_path = str(Path(in_path).absolute())
+
+    files: [(str, str, int)] = []
+    for dirname, _, filenames in os.walk(in_path):
+        for filename in filenames:
+            absname: str = str(Path(dirname).joinpath(filename).absolute())
+            arcname: str = absname[len(in_path) + 1:]
+            files.append((absname, arcname, os.path.getsize(absname)))
+
+    shards: [[(str, str, int)]] = split_files(files, max(1, workers), split_size)
+    if len(shards) == 1:
+        zip_paths: [str] = [in_path + '.zip']
+    else:
+        zip_paths = [in_path + '.%03d.zip' % (i + 1) for i in range(len(shards))]
+
+    with metrics.measure('zip'):
+        if workers > 1 and len(shards) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(write_zip, zip_paths, shards))
+        else:
+            for zip_path, shard in zip(zip_paths, shards):
+                write_zip(zip_path, shard)
+
+    return zip_paths
+
+def split_files(files: [(str, str, int)], workers: int, split_size: int) -> [[(str, str, int)]]:
+    # Fill the shards one after another up to split_size
+    if split_size > 0:
+        shards: [[(str, str, int)]] = [[]]
+        shard_size: int = 0
+        for file in files:
+            if shard_size + file[2] > split_size and len(shards[-1]) > 0:
+                shards.append([])
+                shard_size = 0
+            shards[-1].append(file)
+            shard_size += file[2]
+        return shards
+
+    # Spread the files evenly over the workers, biggest first into the smallest shard
+    shards = [[] for _ in range(min(workers, max(1, len(files))))]
+    shard_sizes: [int] = [0] * len(shards)
+    for file in sorted(files, key=lambda file: file[2], reverse=True):
+        i: int = shard_sizes.index(min(shard_sizes))
+        shards[i].append(file)
+        shard_sizes[i] += file[2]
+    for shard in shards:
+        shard.sort(key=lambda file: file[1])
+    return shards
 
-def create_zip(in_path: str):
-    with zipfile.ZipFile(in_path + '.zip', "w", zipfile.ZIP_DEFLATED) as zf:
-        for dirname, _, files in os.walk(in_path):
-            for filename in files:
-                absname: str = str(Path(dirname).joinpath(filename).absolute())
-                arcname: str = absname[len(in_path) + 1:]
-                # print('zipping ' + arcname)
+def write_zip(zip_path: str, files: [(str, str, int)]) -> None:
+    stage = metrics.stage('zip')
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for absname, arcname, _ in files:
+            # print('zipping ' + arcname)
+            start: float = time.perf_counter()
+            if Path(arcname).suffix.lower() in stored_suffixes:
+                zf.write(absname, arcname, zipfile.ZIP_STORED)
+            else:
                 zf.write(absname, arcname)
+            stage.add_item(time.perf_counter() - start)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,220 @@
+# Canonicalizes the aggregated crawl data (crawl.json) before the generator takes the top values of every attribute:
+# values which look the same are merged and their frequencies summed, so the top values are distinct conditions.
+#   colors: clustered in Lab space, every color within delta_e (CIEDE2000) of a more frequent one is merged into it
+#   font sizes: the closest pixel bucket ('10.6667px' -> '11px')
+#   font weights: numeric ('normal' -> '400', 'bold' -> '700')
+#   font families: the whole stack (the fallbacks decide the rendered font if the first one is not installed), every family without quotes
+from optparse import OptionParser
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('../..')))
+from typing import Callable, Dict
+import json
+import re
+import numpy as np
+from dataset.creation.metrics import metrics
+from dataset.creation.profiling import profiler
+
+color_reg = r'rgba?\(\s*(\d+),\s*(\d+),\s*(\d+)(?:,\s*([\d\.]+))?\s*\)'
+size_reg = r'^([\d\.]+)px$'
+# sRGB -> XYZ and the D65 white point (2° observer), the same constants as colormath
+srgb_to_xyz: np.ndarray = np.array([[0.412424, 0.357579, 0.180464], [0.212656, 0.715158, 0.0721856], [0.0193324, 0.119193, 0.950444]])
+d65: np.ndarray = np.array([0.95047, 1., 1.08883])
+default_size_buckets: [float] = [8, 9, 10, 11, 12, 13, 14, 15, 16, 18, 20, 22, 24, 28, 32, 36, 48, 64, 72]
+weights: Dict[str, str] = {
+    'normal': '400',
+    'bold': '700',
+}
+
+def main() -> None:
+    parser = OptionParser()
+    parser.add_option( '-i',
+                    '--in',
+                    dest = 'in_path',
+                    metavar = 'FILE' )
+    parser.add_option( '-o',
+                    '--out',
+                    dest = 'out_path',
+                    metavar = 'FILE' )
+    parser.add_option( '-d',
+                    '--delta-e',
+                    dest = 'delta_e',
+                    type = 'float',
+                    default = 2.3)
+    parser.add_option( '-b',
+                    '--size-buckets',
+                    dest = 'size_buckets',
+                    default = ','.join([str(size) for size in default_size_buckets]),
+                    metavar = 'PX,PX,...')
+    parser.add_option( '--profile',
+                    dest = 'profile',
+                    metavar = 'FOLDER')
+    parser.add_option( '--profile-mode',
+                    dest = 'profile_mode',
+                    choices = ['sample', 'cprofile'],
+                    default = 'sample')
+    parser.add_option( '--profile-rate',
+                    dest = 'profile_rate',
+                    type = 'float',
+                    default = 100.,
+                    metavar = 'HZ')
+    (options, _) = parser.parse_args()
+
+    profiler.configure(options.profile, options.profile_mode, options.profile_rate)
+    with profiler.profile('canonicalise'):
+        size_buckets: [float] = [float(size) for size in options.size_buckets.split(',')]
+        canonicalise(options.in_path, options.out_path if options.out_path is not None else options.in_path, options.delta_e, size_buckets)
+
+# in_path and out_path may be the same file
+# delta_e: colors closer than this are merged (2.3 is about the smallest difference a human notices)
+# size_buckets: font sizes in px every crawled font size is rounded to
+def canonicalise(in_path: str, out_path: str, delta_e: float = 2.3, size_buckets: [float] = None) -> None:
+    size_buckets = sorted(size_buckets if size_buckets is not None else default_size_buckets)
+    stage = metrics.stage('canonicalise')
+    stage.start()
+    with open(in_path, 'r') as f:
+        log: dict = json.load(f)
+
+    canonical: Dict[str, Callable[[Dict[str, float]], Dict[str, float]]] = {
+        'font_family_dict': lambda values: merge_values(values, canonical_family),
+        'font_size_dict': lambda values: merge_values(values, lambda size: canonical_size(size, size_buckets)),
+        'font_weight_dict': lambda values: merge_values(values, canonical_weight),
+        'font_color_dict': lambda values: cluster_colors(values, delta_e),
+        'background_color_dict': lambda values: cluster_colors(values, delta_e),
+    }
+    for category, function in canonical.items():
+        if category not in log:
+            continue
+        before: int = len(log[category])
+        with stage.phase(category):
+            log[category] = function(log[category])
+        stage.count(category, before - len(log[category]))
+        print(category + ':\t' + str(before) + ' -> ' + str(len(log[category])))
+
+    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, 'w') as f:
+        f.write(json.dumps(log, indent=4))
+        f.write('\n')
+    stage.stop()
+    print('created:\t' + out_path)
+
+# Sums the frequencies of the values with the same canonical value, sorted by frequency
+def merge_values(values: Dict[str, float], canonical: Callable[[str], str]) -> Dict[str, float]:
+    merged: Dict[str, float] = {}
+    for value, frequency in values.items():
+        key: str = canonical(value)
+        merged[key] = merged.get(key, 0.) + frequency
+    return {k: v for k, v in sorted(merged.items(), key=lambda item: item[1], reverse=True)}
+
+# '10.6667px' -> '11px' (closest bucket, the smaller one on a tie), other units are kept
+def canonical_size(size: str, size_buckets: [float]) -> str:
+    size = size.strip().lower()
+    match = re.search(size_reg, size)
+    if match is None:
+        return size
+    pixels: float = float(match.group(1))
+    bucket: float = min(size_buckets, key=lambda b: (abs(b - pixels), b))
+    return ('%g' % bucket) + 'px'
+
+# 'normal' -> '400', 'bold' -> '700', numbers to the closest of 100 ... 900, relative weights ('bolder', 'lighter') are kept
+def canonical_weight(weight: str) -> str:
+    weight = weight.strip().lower()
+    if weight in weights:
+        return weights[weight]
+    try:
+        return str(min(900, max(100, int(round(float(weight) / 100.)) * 100)))
+    except ValueError:
+        return weight
+
+# '"Open Sans",  Arial,sans-serif' -> 'open sans, arial, sans-serif' (duplicates are removed, the order is kept)
+def canonical_family(family: str) -> str:
+    families: [str] = []
+    for name in family.split(','):
+        name = ' '.join(name.strip().strip('"\'').strip().lower().split())
+        if name != '' and name not in families:
+            families.append(name)
+    return ', '.join(families)
+
+# Greedy clustering from the most frequent color on: a color joins the closest cluster within delta_e or starts its own one
+# The most frequent color of a cluster is its key, the clusters are sorted by their summed frequency
+def cluster_colors(colors: Dict[str, float], delta_e: float) -> Dict[str, float]:
+    items: [(str, float)] = sorted(colors.items(), key=lambda item: item[1], reverse=True)
+    labs: np.ndarray = colors_to_lab([color for color, _ in items])
+    keys: [str] = []
+    frequencies: [float] = []
+    # Lab of the clusters and the index of their key
+    centers: np.ndarray = np.empty((len(items), 3))
+    cluster_keys: [int] = []
+    for (color, frequency), lab in zip(items, labs):
+        best: int = -1
+        if not np.isnan(lab[0]) and len(cluster_keys) > 0:
+            distances: np.ndarray = delta_e_cie2000(lab, centers[0:len(cluster_keys)])
+            closest: float = distances.min()
+            if closest <= delta_e:
+                # the last one on a tie
+                best = cluster_keys[np.flatnonzero(distances == closest)[-1]]
+        if best < 0:
+            if not np.isnan(lab[0]):
+                centers[len(cluster_keys)] = lab
+                cluster_keys.append(len(keys))
+            keys.append(color)
+            frequencies.append(frequency)
+        else:
+            frequencies[best] += frequency
+
+    return {k: v for k, v in sorted(zip(keys, frequencies), key=lambda item: item[1], reverse=True)}
+
+# 'rgb(r, g, b)' or 'rgba(r, g, b, a)' as they are seen on a white page to Lab (N x 3), NaN for values which are no color
+def colors_to_lab(colors: [str]) -> np.ndarray:
+    rgba: np.ndarray = np.full((len(colors), 4), np.nan)
+    for i, color in enumerate(colors):
+        match = re.search(color_reg, color)
+        if match is not None:
+            rgba[i] = [float(e) if e is not None else 1. for e in match.groups()]
+    rgb: np.ndarray = rgba[:, 3:4] * rgba[:, 0:3] + (1 - rgba[:, 3:4]) * 255
+    # sRGB -> linear sRGB -> XYZ -> Lab
+    rgb = rgb / 255.
+    rgb = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz: np.ndarray = rgb @ srgb_to_xyz.T / d65
+    f: np.ndarray = np.where(xyz > 216. / 24389., np.cbrt(xyz), 7.787 * xyz + 16. / 116.)
+    return np.stack([116. * f[:, 1] - 16., 500. * (f[:, 0] - f[:, 1]), 200. * (f[:, 1] - f[:, 2])], axis=1)
+
+# CIEDE2000 of a Lab color (3) to every Lab color of labs (K x 3), the formula of colormath
+def delta_e_cie2000(lab: np.ndarray, labs: np.ndarray) -> np.ndarray:
+    L, a, b = lab
+    avg_Lp: np.ndarray = (L + labs[:, 0]) / 2.
+    C1: float = np.sqrt(a ** 2 + b ** 2)
+    C2: np.ndarray = np.sqrt(labs[:, 1] ** 2 + labs[:, 2] ** 2)
+    avg_C1_C2: np.ndarray = (C1 + C2) / 2.
+    G: np.ndarray = 0.5 * (1 - np.sqrt(avg_C1_C2 ** 7 / (avg_C1_C2 ** 7 + 25. ** 7)))
+    a1p: np.ndarray = (1 + G) * a
+    a2p: np.ndarray = (1 + G) * labs[:, 1]
+    C1p: np.ndarray = np.sqrt(a1p ** 2 + b ** 2)
+    C2p: np.ndarray = np.sqrt(a2p ** 2 + labs[:, 2] ** 2)
+    avg_C1p_C2p: np.ndarray = (C1p + C2p) / 2.
+
+    h1p: np.ndarray = np.degrees(np.arctan2(b, a1p))
+    h1p += (h1p < 0) * 360
+    h2p: np.ndarray = np.degrees(np.arctan2(labs[:, 2], a2p))
+    h2p += (h2p < 0) * 360
+    avg_Hp: np.ndarray = (((np.fabs(h1p - h2p) > 180) * 360) + h1p + h2p) / 2.
+    T: np.ndarray = 1 - 0.17 * np.cos(np.radians(avg_Hp - 30)) + 0.24 * np.cos(np.radians(2 * avg_Hp)) + \
+        0.32 * np.cos(np.radians(3 * avg_Hp + 6)) - 0.2 * np.cos(np.radians(4 * avg_Hp - 63))
+
+    diff_h2p_h1p: np.ndarray = h2p - h1p
+    delta_hp: np.ndarray = diff_h2p_h1p + (np.fabs(diff_h2p_h1p) > 180) * 360
+    delta_hp -= (h2p > h1p) * 720
+    delta_Lp: np.ndarray = labs[:, 0] - L
+    delta_Cp: np.ndarray = C2p - C1p
+    delta_Hp: np.ndarray = 2 * np.sqrt(C2p * C1p) * np.sin(np.radians(delta_hp) / 2.)
+
+    S_L: np.ndarray = 1 + ((0.015 * (avg_Lp - 50) ** 2) / np.sqrt(20 + (avg_Lp - 50) ** 2))
+    S_C: np.ndarray = 1 + 0.045 * avg_C1p_C2p
+    S_H: np.ndarray = 1 + 0.015 * avg_C1p_C2p * T
+    delta_ro: np.ndarray = 30 * np.exp(-(((avg_Hp - 275) / 25.) ** 2))
+    R_C: np.ndarray = np.sqrt(avg_C1p_C2p ** 7 / (avg_C1p_C2p ** 7 + 25. ** 7))
+    R_T: np.ndarray = -2 * R_C * np.sin(2 * np.radians(delta_ro))
+    return np.sqrt((delta_Lp / S_L) ** 2 + (delta_Cp / S_C) ** 2 + (delta_Hp / S_H) ** 2 + R_T * (delta_Cp / S_C) * (delta_Hp / S_H))
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,14 @@
 from optparse import OptionParser
 from requests_html import HTMLSession
 from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('../..')))
 import json
 import re
 import pprint
+import time
+from dataset.creation.metrics import metrics
+from dataset.creation.profiling import profiler
 
 def main() -> None:
     parser = OptionParser()
@@ -15,9 +20,23 @@ def main() -> None:
                 '--out',
                 dest = 'out_path',
                 metavar = 'FILE' )
+    parser.add_option( '--profile',
+                    dest = 'profile',
+                    metavar = 'FOLDER')
+    parser.add_option( '--profile-mode',
+                    dest = 'profile_mode',
+                    choices = ['sample', 'cprofile'],
+                    default = 'sample')
+    parser.add_option( '--profile-rate',
+                    dest = 'profile_rate',
+                    type = 'float',
+                    default = 100.,
+                    metavar = 'HZ')
     (options, args) = parser.parse_args()
 
-    crawl(options.in_path, options.out_path)
+    profiler.configure(options.profile, options.profile_mode, options.profile_rate)
+    with profiler.profile('crawl'):
+        crawl(options.in_path, options.out_path)
 
 
 def crawl(in_path: str, out_path: str) -> None:
@@ -36,9 +55,12 @@ def crawl(in_path: str, out_path: str) -> None:
             urls.append((url).replace('\n', '').lower())
 
     # print(urls)
+    stage = metrics.stage('crawl')
+    stage.start()
     results = []
     for url in urls:
         print('Loading: ' + url)
+        start: float = time.perf_counter()
 
         retrieve_style = """
             async () => {
@@ -145,7 +167,8 @@ def crawl(in_path: str, out_path: str) -> None:
 
         try:
             session = HTMLSession()
-            r = session.get(url)
+            with stage.phase('fetch'):
+                r = session.get(url)
             # def render(self, 
             # retries: int = 8, 
             # script: str = None, 
@@ -157,10 +180,13 @@ def crawl(in_path: str, out_path: str) -> None:
             # keep_page: bool = False, 
             # cookies: list = [{}], 
             # send_cookies_session: bool = False):
-            res = r.html.render(script = retrieve_style, retries = 5, timeout = 10.0)
+            with stage.phase('script'):
+                res = r.html.render(script = retrieve_style, retries = 5, timeout = 10.0)
         except Exception as e:
             print(e)
             res = {'status': 'fail'}
+        stage.add_item(time.perf_counter() - start)
+        stage.count(res.get('status', 'fail'))
 
         # session = HTMLSession()
         # r = session.get(url)
@@ -175,6 +201,7 @@ def crawl(in_path: str, out_path: str) -> None:
         f.write('\n')
 
     # Processing
+    aggregate_start: float = time.perf_counter()
     failed: [str] = []
     succeeded: [str] = []
     font_family_dict: [str] = {}
@@ -286,6 +313,9 @@ def crawl(in_path: str, out_path: str) -> None:
     font_color_dict = {k: v / total for k, v in sorted(font_color_dict.items(), key=lambda item: item[1], reverse=True)}
     background_color_dict = {k: v / total for k, v in sorted(background_color_dict.items(), key=lambda item: item[1], reverse=True)}
 
+    stage.add_phase('aggregate', time.perf_counter() - aggregate_start)
+    stage.stop()
+
     log = {
         'succeeded': succeeded,
         'failed': failed,
@@ -301,7 +331,7 @@ def crawl(in_path: str, out_path: str) -> None:
 
     # print(font_color_dict)
 
-    with open('/home/christopher/Git/OCROnWebpages/results/crawl.json', 'w') as f:
+    with open(out_path, 'w') as f:
         f.write(json.dumps(log, indent=4))
         f.write('\n')
 
@@ -1,10 +1,21 @@
 import argparse
 import time
 from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('..')))
+from concurrent.futures import ProcessPoolExecutor
+import os
 import re
+import csv
+import codecs
+import random
+import json
+import numpy as np
 import cv2
-import matplotlib.pyplot as plt
 import progressbar
+from dataset.creation.metrics import metrics
+from dataset.creation.profiling import profiler
+from dataset.creation.manifest import get_files
 
 def main() -> None:
     parser = argparse.ArgumentParser(description='Add bounding boxes to image.')
@@ -14,13 +25,39 @@ def main() -> None:
     parser.add_argument('input_txt', metavar='input_txt', type=str, nargs=1, help='a directory containing the labels')
     # Output Directory
     parser.add_argument('output', metavar='output', type=str, nargs=1, help='a directory for the output')
+    # Workers
+    parser.add_argument('-w', '--workers', metavar='workers', type=int, default=1, help='how many processes should draw the boxes? (Default is 1)')
+    # Sample
+    parser.add_argument('--sample', metavar='sample', type=int, default=0, help='only draw the boxes for a random sample of this many images')
+    # Errors
+    parser.add_argument('--errors', metavar='evaluation', type=str, default=None, help='only draw the boxes for images with errors in this evaluation csv')
+    # Force
+    parser.add_argument('-f', '--force', action='store_true', help='also draw images which are already up to date')
+    # Worst
+    parser.add_argument('--worst', metavar='worst', type=int, default=0, help='draw ideal & recognized boxes of the worst images in --errors (needs the matches of evaluation.py -m, input_txt is not used)')
+    # Worst by
+    parser.add_argument('--by', metavar='by', type=str, choices=['fn', 'fp'], default='fn', help='rank the worst images by their FN or FP rate (Default is fn)')
+    # Profiling
+    parser.add_argument('--profile', metavar='folder', type=str, default=None, help='save a sampled (and with --profile-mode cprofile a cProfile) profile of the run to this folder')
+    parser.add_argument('--profile-mode', metavar='mode', type=str, choices=['sample', 'cprofile'], default='sample', help='sample (cheap) or cprofile (deterministic, slow) (Default is sample)')
+    parser.add_argument('--profile-rate', metavar='hz', type=float, default=100., help='samples per second (Default is 100)')
 
     args = parser.parse_args()
+    if args.worst > 0:
+        if args.errors is None:
+            parser.error('--worst needs --errors <evaluation csv>')
+        if not Path(get_matches_path(args.errors)).exists():
+            parser.error('no matches next to ' + args.errors + ' (' + get_matches_path(args.errors) + '), run evaluation.py with -m first')
 
-    add_boxes(args.input_img[0], args.input_txt[0], args.output[0])
+    profiler.configure(args.profile, args.profile_mode, args.profile_rate)
+    with profiler.profile('add_boxes'):
+        if args.worst > 0:
+            add_error_boxes(args.input_img[0], args.errors, args.output[0], args.worst, args.by, args.workers)
+        else:
+            add_boxes(args.input_img[0], args.input_txt[0], args.output[0], args.workers, args.sample, args.errors, args.force)
 
 
-def add_boxes(in_imgs: str, in_txts: str, out: str):
+def add_boxes(in_imgs: str, in_txts: str, out: str, workers: int = 1, sample: int = 0, errors: str = None, force: bool = False):
     # INPUT FEEDBACK
     # Paths
     input_img_path: Path = Path(in_imgs).absolute()
@@ -31,48 +68,181 @@ def add_boxes(in_imgs: str, in_txts: str, out: str):
     load_root = root.joinpath(input_img_path)
     print(str(load_root))
 
-    files = []
+    files: [Path] = get_files(load_root, '.png')
 
-    for path in Path(load_root).rglob('*.png'):
-        files.append(path)
+    if errors is not None:
+        files = filter_errors(files, input_img_path, errors)
+    if 0 < sample < len(files):
+        files = random.sample(files, sample)
+
+    # (image, labels, output)
+    jobs: [(str, str, str)] = []
+    for p in files:
+        relative_path: Path = p.relative_to(input_img_path)
+        txt_path: str = str(input_txt_path.joinpath(relative_path).with_suffix('.txt'))
+        save_path: str = str(output_path.joinpath(relative_path))
+        if not force and is_up_to_date(save_path, str(p), txt_path):
+            continue
+        jobs.append((str(p), txt_path, save_path))
+
+    print('Drawing ' + str(len(jobs)) + ' of ' + str(len(files)) + ' images (' + str(len(files) - len(jobs)) + ' up to date)')
+
+    start_whole = time.time()
+
+    with metrics.measure('add_boxes') as stage:
+        stage.count('up_to_date', len(files) - len(jobs))
+        run_jobs(add_boxes_job, jobs, workers, stage)
+
+    end_whole = time.time()
+    print('Whole:', end_whole - start_whole)
+
+# Draws the matching of evaluation.py for the worst images
+#   ideal:      green (TP, determined) / yellow (TP, not determined) / red (FN)
+#   recognized: blue (matched) / magenta (FP)
+def add_error_boxes(in_imgs: str, evaluation: str, out: str, worst: int = 1000, by: str = 'fn', workers: int = 1):
+    input_img_path: Path = Path(in_imgs).absolute()
+    output_path: Path = Path(out).absolute()
+    matches_path: str = get_matches_path(evaluation)
+
+    # Rank the files by their FN rate (FN / (TP + FN)) or FP rate (FP / (TP + FP))
+    tp_l: [int] = []
+    errors_l: [int] = []
+    with codecs.open(evaluation, 'r', 'utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            tp_l.append(int(row['tp_l'] or 0))
+            errors_l.append(int(row[by + '_l'] or 0))
+    tps: np.ndarray = np.array(tp_l, dtype=np.float64)
+    errs: np.ndarray = np.array(errors_l, dtype=np.float64)
+    rates: np.ndarray = np.zeros(len(errs))
+    np.divide(errs, tps + errs, out=rates, where=(tps + errs) > 0)
+    selected: np.ndarray = np.argsort(-rates, kind='stable')[:worst]
+    selected = selected[rates[selected] > 0]
+    wanted: set = set(selected.tolist())
+    print('Drawing the ' + str(len(wanted)) + ' worst of ' + str(len(rates)) + ' images by ' + by.upper() + ' rate')
+
+    # The matches are in the same order as the csv, only the wanted lines are parsed
+    jobs: [(str, str, dict)] = []
+    with codecs.open(matches_path, 'r', 'utf-8') as f:
+        for i, line in enumerate(f):
+            if i not in wanted:
+                continue
+            matching: dict = json.loads(line)
+            img_path: str = str(input_img_path.joinpath(matching['path'] + '.png'))
+            save_path: str = str(output_path.joinpath(matching['path'] + '.png'))
+            jobs.append((img_path, save_path, matching))
+            if len(jobs) == len(wanted):
+                break
 
     start_whole = time.time()
 
-    for i in progressbar.progressbar(range(len(files))):
-        p = files[i]
-        start = time.time()
-
-        all_coordinates: [[int]] = []
-
-        txt_path: str = (str(p).replace(str(input_img_path), str(input_txt_path))).replace('.png', '.txt')
-        with open(txt_path, 'r') as f:
-            for l in f:
-                if 'file://' in l:
-                    continue
-                coordinate_tuple: [int] = []
-                try:
-                    coordinates = re.search(r'([0-9]+),([0-9]+),([0-9]+),([0-9]+)', l).groups()
-                except:
-                    continue
-                for coordinate in coordinates:
-                    coordinate_tuple.append(int(float(coordinate)))
-                all_coordinates.append(tuple(coordinate_tuple))
-        #print(all_coordinates)
-
-        img = cv2.imread(str(p))
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-        for coordinate_tuple in all_coordinates:
-            (left, top, width, height) = coordinate_tuple 
-            cv2.rectangle(img, (left, top), (left + width, top + height), (0, 255, 0), 2)
-
-        save_path = str(p).replace(str(input_img_path), str(output_path))
-        Path(save_path).parent.mkdir(parents=True, exist_ok=True)
-        plt.imsave(save_path, img)
-        end = time.time()
+    with metrics.measure('add_error_boxes') as stage:
+        run_jobs(add_error_boxes_job, jobs, workers, stage)
 
     end_whole = time.time()
     print('Whole:', end_whole - start_whole)
 
+# The matches saved by evaluation.py -m next to the evaluation csv
+def get_matches_path(evaluation: str) -> str:
+    return str(Path(evaluation).with_suffix('')) + '_matches.jsonl'
+
+# Runs the jobs in a process pool if there is more than one worker, every job returns its duration
+def run_jobs(function, jobs: list, workers: int, stage) -> None:
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(function, jobs, chunksize=max(1, min(64, len(jobs) // (workers * 4))))
+            for seconds in progressbar.progressbar(results, max_value=len(jobs)):
+                stage.add_item(seconds)
+    else:
+        for job in progressbar.progressbar(jobs):
+            stage.add_item(function(job))
+
+def add_boxes_job(job: (str, str, str)) -> float:
+    start: float = time.perf_counter()
+    add_boxes_file(*job)
+    return time.perf_counter() - start
+
+def add_error_boxes_job(job: (str, str, dict)) -> float:
+    start: float = time.perf_counter()
+    add_error_boxes_file(*job)
+    return time.perf_counter() - start
+
+def add_error_boxes_file(img_path: str, save_path: str, matching: dict) -> None:
+    ideal_colors: [(int, int, int)] = [(0, 0, 255)] * len(matching['ideal'])
+    recognized_colors: [(int, int, int)] = [(255, 0, 255)] * len(matching['recognized'])
+    for ideal_index, recognized_index, determined in matching['matches']:
+        ideal_colors[ideal_index] = (0, 255, 0) if determined else (0, 255, 255)
+        recognized_colors[recognized_index] = (255, 0, 0)
+
+    img = cv2.imread(img_path)
+
+    for box, color in zip(matching['recognized'], recognized_colors):
+        if box is not None:
+            (left, top, width, height) = box
+            cv2.rectangle(img, (left, top), (left + width, top + height), color, 1)
+    for box, color in zip(matching['ideal'], ideal_colors):
+        if box is not None:
+            (left, top, width, height) = box
+            cv2.rectangle(img, (left, top), (left + width, top + height), color, 2)
+
+    Path(save_path).parent.mkdir(parents=True, exist_ok=True)
+    cv2.imwrite(save_path, img)
+
+def add_boxes_file(img_path: str, txt_path: str, save_path: str) -> None:
+    all_coordinates: [[int]] = read_boxes(txt_path)
+
+    img = cv2.imread(img_path)
+
+    # cv2 works in BGR, (0, 255, 0) is green either way
+    for coordinate_tuple in all_coordinates:
+        (left, top, width, height) = coordinate_tuple
+        cv2.rectangle(img, (left, top), (left + width, top + height), (0, 255, 0), 2)
+
+    Path(save_path).parent.mkdir(parents=True, exist_ok=True)
+    cv2.imwrite(save_path, img)
+
+def read_boxes(txt_path: str) -> [(int, int, int, int)]:
+    all_coordinates: [(int, int, int, int)] = []
+    with open(txt_path, 'r') as f:
+        for l in f:
+            if 'file://' in l:
+                continue
+            coordinate_tuple: [int] = []
+            try:
+                coordinates = re.search(r'([0-9]+),([0-9]+),([0-9]+),([0-9]+)', l).groups()
+            except:
+                continue
+            for coordinate in coordinates:
+                coordinate_tuple.append(int(float(coordinate)))
+            all_coordinates.append(tuple(coordinate_tuple))
+    return all_coordinates
+
+def is_up_to_date(save_path: str, *input_paths: str) -> bool:
+    try:
+        saved: float = os.stat(save_path).st_mtime
+        return all(saved >= os.stat(p).st_mtime for p in input_paths)
+    except OSError:
+        return False
+
+# Keeps the images which have a FP, FN or F_d in the evaluation csv (its paths point to the recognized dataset)
+def filter_errors(files: [Path], input_img_path: Path, evaluation_path: str) -> [Path]:
+    error_paths: set = set()
+    with codecs.open(evaluation_path, 'r', 'utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            if int(row['fp_l'] or 0) + int(row['fn_l'] or 0) + int(row['f_d'] or 0) > 0:
+                error_paths.add(str(Path(row['path']).with_suffix('')))
+    if len(error_paths) == 0:
+        return []
+
+    # Find the root of the recognized dataset by one of its files
+    any_error: str = next(iter(error_paths))
+    relative_paths: [str] = [str(p.relative_to(input_img_path).with_suffix('')) for p in files]
+    error_root: str = ''
+    for relative_path in relative_paths:
+        if any_error.endswith(os.sep + relative_path):
+            error_root = any_error[:-len(relative_path)]
+            break
+
+    return [p for p, relative_path in zip(files, relative_paths) if error_root + relative_path in error_paths]
+
 if __name__ == '__main__':
     main()
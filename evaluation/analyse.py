@@ -0,0 +1,181 @@
+# Break the evaluation results down by the style attributes of the documents.
+# Usage: analyse.py evaluation.csv -o output
+# (evaluation.csv is a per file result of evaluation.py)
+
+# Imports
+import argparse
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('..')))
+from itertools import combinations
+from typing import Dict, List, Tuple, Union
+import numpy as np
+import csv
+import codecs
+from dataset.creation.layout import Layout
+
+# Type Definitions
+# attribute(s) and value(s): str, documents and counts: int, metrics: float
+Row = Dict[str, Union[str, int, float]]
+
+# The attributes baked into the path by generate_html():
+# content_variant/font_family/font_size/font_style/font_weight/text_decoration_line/font_color/background_color/layout/content_source
+# images_only: content_variant/background_color/index of the layout
+ATTRIBUTES: [str] = ['content_variant', 'font_family', 'font_size', 'font_style', 'font_weight', 'text_decoration_line', 'font_color', 'background_color', 'layout', 'content_source']
+CONTENT_VARIANTS: [str] = ['images_only', 'only_text', 'with_images']
+COUNTS: [str] = ['tp_l', 'fp_l', 'fn_l', 't_d', 'f_d', 'time_l', 'time_d']
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Break the evaluation results down by document attributes.')
+    # Evaluation CSV
+    parser.add_argument('evaluation', metavar='evaluation', type=str, nargs=1, help='a csv file created by evaluation.py')
+    # Output Directory
+    parser.add_argument('-o', metavar='output', type=str, nargs=1, help='A path where the results can be saved.')
+    # Attributes
+    parser.add_argument('-a', metavar='attributes', type=str, nargs='+', default=ATTRIBUTES, help='the attributes to group by (Default are all)')
+    # Pairs
+    parser.add_argument('--no-pairs', dest='pairs', action='store_false', help='do not group by attribute pairs')
+    args = parser.parse_args()
+
+    analyse(Path(args.evaluation[0]).absolute(), Path(args.o[0]).absolute(), args.a, args.pairs)
+
+
+def analyse(evaluation_path: Path, outpath: Path, attributes: [str] = ATTRIBUTES, pairs: bool = True) -> None:
+    outpath.mkdir(parents=True, exist_ok=True)
+
+    print('Loading:\t' + str(evaluation_path))
+    analysis: Analysis = Analysis(evaluation_path)
+    print('Documents:\t' + str(len(analysis)))
+
+    rows: [Row] = []
+    for attribute in attributes:
+        rows += analysis.group(attribute)
+    csv_filename: str = str(outpath.joinpath('analysis_' + evaluation_path.stem + '_attributes.csv'))
+    save_rows(csv_filename, rows)
+    print('created:\t' + csv_filename)
+
+    if pairs:
+        rows = []
+        for attribute_a, attribute_b in combinations(attributes, 2):
+            rows += analysis.group(attribute_a, attribute_b)
+        csv_filename = str(outpath.joinpath('analysis_' + evaluation_path.stem + '_pairs.csv'))
+        save_rows(csv_filename, rows)
+        print('created:\t' + csv_filename)
+
+
+class Analysis(object):
+    # Loads an evaluation csv once, every group() afterwards only works on integer codes.
+    def __init__(self, evaluation_path: Path) -> None:
+        paths: [str] = []
+        counts: [[int]] = []
+        with codecs.open(str(evaluation_path), 'r', 'utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                paths.append(row['path'])
+                counts.append([int(row[key] or 0) for key in COUNTS])
+
+        self.counts: np.ndarray = np.array(counts, dtype=np.int64).reshape(-1, len(COUNTS))
+
+        # Factorize every attribute: codes[i] is the index of the value of document i in values
+        self.codes: Dict[str, np.ndarray] = {}
+        self.values: Dict[str, List[str]] = {}
+        columns = zip(*[get_attributes(path) for path in paths]) if paths else [()] * len(ATTRIBUTES)
+        for attribute, column in zip(ATTRIBUTES, columns):
+            index: Dict[str, int] = {}
+            codes = [index.setdefault(value, len(index)) for value in column]
+            self.codes[attribute] = np.array(codes, dtype=np.int64)
+            self.values[attribute] = list(index.keys())
+
+    def __len__(self) -> int:
+        return self.counts.shape[0]
+
+    def group(self, *attributes: str) -> [Row]:
+        if len(attributes) == 0 or len(self) == 0:
+            return []
+
+        # Combine the codes of all attributes into a single key per document
+        key: np.ndarray = np.zeros(len(self), dtype=np.int64)
+        for attribute in attributes:
+            key = key * len(self.values[attribute]) + self.codes[attribute]
+        keys, inverse = np.unique(key, return_inverse=True)
+
+        documents: np.ndarray = np.bincount(inverse, minlength=len(keys))
+        sums: np.ndarray = np.stack([np.bincount(inverse, weights=self.counts[:, i], minlength=len(keys)) for i in range(len(COUNTS))], axis=1)
+        metrics: Dict[str, np.ndarray] = get_metrics(sums, documents)
+
+        # Decode the combined keys back into their values
+        decoded: [[str]] = []
+        remainder: np.ndarray = keys.copy()
+        for attribute in reversed(attributes):
+            size: int = len(self.values[attribute])
+            decoded.insert(0, [self.values[attribute][code] for code in remainder % size])
+            remainder = remainder // size
+
+        rows: [Row] = []
+        for i in np.argsort(metrics['fone_score_l'], kind='stable'):
+            row: Row = {}
+            for j, attribute in enumerate(attributes):
+                suffix: str = '' if len(attributes) == 1 else '_' + 'ab'[j]
+                row['attribute' + suffix] = attribute
+                row['value' + suffix] = decoded[j][i]
+            row['documents'] = int(documents[i])
+            for j, name in enumerate(COUNTS):
+                row[name] = int(sums[i, j])
+            for name, values in metrics.items():
+                row[name] = float(values[i])
+            rows.append(row)
+        return rows
+
+
+def get_attributes(path: str) -> Tuple[str, ...]:
+    parts: [str] = Path(path).with_suffix('').parts
+    for i in range(len(parts) - 1, -1, -1):
+        if parts[i] in CONTENT_VARIANTS:
+            found: [str] = list(parts[i:])
+            break
+    else:
+        return ('',) * len(ATTRIBUTES)
+
+    if found[0] == 'images_only':
+        # content_variant/background_color/layout (its index, the name as for the text documents)
+        layout: str = found[2] if len(found) > 2 else ''
+        if layout.isdigit() and int(layout) < len(Layout):
+            layout = list(Layout)[int(layout)].name
+        found = [found[0], '', '', '', '', '', ''] + found[1:2] + [layout, '']
+    found += [''] * (len(ATTRIBUTES) - len(found))
+    return tuple(found[:len(ATTRIBUTES)])
+
+def get_metrics(sums: np.ndarray, documents: np.ndarray) -> Dict[str, np.ndarray]:
+    tp_l, fp_l, fn_l, t_d, f_d, time_l, time_d = [sums[:, i] for i in range(len(COUNTS))]
+
+    precision_l: np.ndarray = divide(tp_l, tp_l + fp_l)
+    recall_l: np.ndarray = divide(tp_l, tp_l + fn_l)
+    fone_score_l: np.ndarray = divide(2 * precision_l * recall_l, precision_l + recall_l)
+    fone_score_l[(precision_l < 0) | (recall_l < 0)] = -1.0
+
+    return {
+        'accuracy_l': divide(tp_l, tp_l + fp_l + fn_l),
+        'precision_l': precision_l,
+        'recall_l': recall_l,
+        'fone_score_l': fone_score_l,
+        'precision_d': divide(t_d, t_d + f_d),
+        'mean_time_l': divide(time_l, documents),
+        'mean_time_d': divide(time_d, documents),
+    }
+
+# Same convention as evaluation.py: -1.0 if the value is not defined
+def divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    out: np.ndarray = np.full(numerator.shape, -1.0)
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    return out
+
+def save_rows(filename: str, rows: [Row]) -> None:
+    with codecs.open(filename, 'w', 'utf-8-sig') as f:
+        if len(rows) == 0:
+            return
+        dict_writer = csv.DictWriter(f, rows[0].keys())
+        dict_writer.writeheader()
+        dict_writer.writerows(rows)
+
+if __name__ == '__main__':
+    main()
@@ -5,12 +5,19 @@
 # Imports
 import argparse
 from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('..')))
 from typing import Dict, Tuple
 import re
 import Levenshtein.StringMatcher as levenshtein
 import progressbar
 import csv
 import codecs
+import json
+import time
+from dataset.creation.metrics import metrics
+from dataset.creation.profiling import profiler
+from dataset.creation.manifest import get_files
 
 # Type Definitions
 Line = Dict[str, str]
@@ -29,14 +36,26 @@ def main() -> None:
     parser.add_argument('-cp', metavar='coordinate_percent', type=float, nargs=1, default=1.0, help='how many percent of the ground truth box should be in the accepted box? (Default ist 1.0)')
     # Accepted Levenshtein Distance
     parser.add_argument('-lp', metavar='levenshtein_percent', type=float, nargs=1, default=1.0, help='how off can the determination be? (Default is 1.0)')
+    # Save the matching of every file
+    parser.add_argument('-m', '--matches', action='store_true', help='save the boxes and their matching for every file (needed by add_boxes.py --worst)')
+    # Metrics
+    parser.add_argument('--metrics', metavar='metrics', type=str, default=None, help='save timing and memory metrics of the evaluation to this json file')
+    # Profiling
+    parser.add_argument('--profile', metavar='folder', type=str, default=None, help='save a sampled (and with --profile-mode cprofile a cProfile) profile of the run to this folder')
+    parser.add_argument('--profile-mode', metavar='mode', type=str, choices=['sample', 'cprofile'], default='sample', help='sample (cheap) or cprofile (deterministic, slow) (Default is sample)')
+    parser.add_argument('--profile-rate', metavar='hz', type=float, default=100., help='samples per second (Default is 100)')
     args = parser.parse_args()
 
     coordinate_percent: float = args.cp[0] if isinstance(args.cp, list) else args.cp
     levenshtein_percent: float = args.lp[0] if isinstance(args.lp, list) else args.lp
-    evaluate(Path(args.ideal[0]).absolute(), Path(args.recognized[0]).absolute(), Path(args.o[0]).absolute(), coordinate_percent, levenshtein_percent)
+    profiler.configure(args.profile, args.profile_mode, args.profile_rate)
+    with profiler.profile('evaluate'):
+        evaluate(Path(args.ideal[0]).absolute(), Path(args.recognized[0]).absolute(), Path(args.o[0]).absolute(), coordinate_percent, levenshtein_percent, args.matches)
+    if args.metrics is not None:
+        metrics.save(args.metrics)
 
 
-def evaluate(ideal_path, recognized_path, outpath, coordinate_percent, levenshtein_percent):
+def evaluate(ideal_path, recognized_path, outpath, coordinate_percent, levenshtein_percent, save_matches=False):
     # INPUT FEEDBACK
     outpath.mkdir(parents=True, exist_ok=True)
 
@@ -51,9 +70,7 @@ def evaluate(ideal_path, recognized_path, outpath, coordinate_percent, levenshte
     print('Levenshtein Percent:\t' + str(levenshtein_percent))
     print('\n')
 
-    ideal_files: [Path] = []
-    for path in Path(ideal_path).rglob('*.txt'):
-        ideal_files.append(path.absolute())
+    ideal_files: [Path] = get_files(ideal_path, '.txt')
 
     # Values
     overall_TP_l: int = 0    # True Positives   (ideal coordinate in recognized coordinates)
@@ -64,8 +81,19 @@ def evaluate(ideal_path, recognized_path, outpath, coordinate_percent, levenshte
 
     file_results: [Result] = [{'path': '', 'tp_l': '', 'fp_l': '', 'fn_l': '', 't_d': '', 'f_d': '', 'time_l': '', 'time_d': '', 'time_c': ''}]
 
+    out_name: str = 'evaluation_' + ideal_path.name + '_' + recognized_path.name + '_cp' + str(coordinate_percent).replace('.', '') + '_lp' + str(levenshtein_percent).replace('.', '')
+
+    # One line per file (same order as the csv): the boxes and which ideal box matched which recognized box
+    matches_file = None
+    if save_matches:
+        matches_filename: str = str(outpath.joinpath(out_name + '_matches.jsonl'))
+        matches_file = codecs.open(matches_filename, 'w', 'utf-8')
+
     # EVALUATE THE FILES
+    stage = metrics.stage('evaluate')
+    stage.start()
     for i in progressbar.progressbar(range(len(ideal_files))):
+        parse_start: float = time.perf_counter()
         ideal_file_path = ideal_files[i]
         recognized_file_path: str = str(get_recognized(ideal_file_path, ideal_path, recognized_path))
 
@@ -102,18 +130,24 @@ def evaluate(ideal_path, recognized_path, outpath, coordinate_percent, levenshte
         file_result: Result = {'path': recognized_file_path, 'tp_l': '', 'fp_l': '', 'fn_l': '', 't_d': '', 'f_d': ''}
 
         # LOCALISATION
+        match_start: float = time.perf_counter()
+        stage.add_phase('parse', match_start - parse_start)
         TP_l: int = 0    # True Positives   (ideal coordinate in recognized coordinates)
         FP_l: int = 0    # False Positives  (recognized coordinate not in ideal coordinates)
         FN_l: int = 0    # False Negatives  (ideal coordinate not in recognized coordinates)
         determination_pairs: [(Line, str)] = []
+        matched_indexes: [(int, int)] = []     # (ideal index, recognized index)
         recognized_copy = recognized.copy()
-        for ideal_line in ideal:
+        recognized_indexes: [int] = list(range(len(recognized)))
+        for ideal_index, ideal_line in enumerate(ideal):
             found: bool = False
             for i in range(len(recognized_copy)):
                 if validate_coordinate(ideal_line, recognized_copy[i], coordinate_percent):
                     found = True
                     determination_pairs.append((recognized_copy[i]['word'], ideal_line['word']))
+                    matched_indexes.append((ideal_index, recognized_indexes[i]))
                     del recognized_copy[i]
+                    del recognized_indexes[i]
                     break
             if found:
                 TP_l += 1
@@ -132,12 +166,17 @@ def evaluate(ideal_path, recognized_path, outpath, coordinate_percent, levenshte
         overall_FN_l += FN_l
 
         # DETERMINATION
+        levenshtein_start: float = time.perf_counter()
+        stage.add_phase('match', levenshtein_start - match_start)
         T_d: int = 0    # Word was recognized
         F_d: int = 0    # Word was not recognized
+        determined: [bool] = []
         for ideal_word, recognized_word in determination_pairs:
-            if validate_word(ideal_word, recognized_word, levenshtein_percent):
+            determined.append(validate_word(ideal_word, recognized_word, levenshtein_percent))
+            if determined[-1]:
                 T_d += 1
         F_d = len(determination_pairs) - T_d
+        stage.add_phase('levenshtein', time.perf_counter() - levenshtein_start)
 
         # save the values
         file_result['t_d'] = str(T_d)
@@ -150,6 +189,20 @@ def evaluate(ideal_path, recognized_path, outpath, coordinate_percent, levenshte
 
         file_results.append(file_result)
 
+        if matches_file is not None:
+            matches_file.write(json.dumps({
+                'path': str(ideal_file_path.relative_to(ideal_path).with_suffix('')),
+                'ideal': [get_box(line) for line in ideal],
+                'recognized': [get_box(line) for line in recognized],
+                'matches': [[ideal_index, recognized_index, int(ok)] for (ideal_index, recognized_index), ok in zip(matched_indexes, determined)],
+                }) + '\n')
+
+        stage.add_item(time.perf_counter() - parse_start)
+
+    stage.stop()
+    if matches_file is not None:
+        matches_file.close()
+
     # Remove first empty result
     if len(file_results) > 1:
         del file_results[0]
@@ -216,21 +269,23 @@ def evaluate(ideal_path, recognized_path, outpath, coordinate_percent, levenshte
     print('\n' + log)
 
     # Save the evaluation results
-    log_filename: str = str(outpath.joinpath('evaluation_' + ideal_path.name + '_' + recognized_path.name + '_cp' + str(coordinate_percent).replace('.', '') + '_lp' + str(levenshtein_percent).replace('.', '') + '.txt'))
+    log_filename: str = str(outpath.joinpath(out_name + '.txt'))
     with codecs.open(log_filename, 'w', "utf-8-sig") as f:
         f.write(log)
     print('\ncreated:\t' + log_filename)
 
-    csv_filename: str = str(outpath.joinpath('evaluation_' + ideal_path.name + '_' + recognized_path.name + '_cp' + str(coordinate_percent).replace('.', '') + '_lp' + str(levenshtein_percent).replace('.', '') + '.csv'))
+    csv_filename: str = str(outpath.joinpath(out_name + '.csv'))
     csv_keys = file_results[0].keys()
     with codecs.open(csv_filename, 'w', "utf-8-sig") as f:
         dict_writer = csv.DictWriter(f, csv_keys)
         dict_writer.writeheader()
         dict_writer.writerows(file_results)
     print('created:\t' + csv_filename)
+    if matches_file is not None:
+        print('created:\t' + matches_filename)
 
 def get_recognized(file_path: Path, ideal_path: Path, recognized_path: Path) -> Path:
-    return Path(str(file_path).replace(str(ideal_path),str(recognized_path)))
+    return Path(recognized_path).joinpath(Path(file_path).relative_to(ideal_path))
 
 def get_word_coordinate_dict(line: str) -> Line:
     output: Line = {'word': '', 'left': '', 'top': '', 'width': '', 'height': ''}
@@ -248,6 +303,12 @@ def get_word_coordinate_dict(line: str) -> Line:
 
     return output
 
+def get_box(line: Line) -> [int]:
+    try:
+        return [int(line['left']), int(line['top']), int(line['width']), int(line['height'])]
+    except ValueError:
+        return None
+
 def get_time(line: str) -> int:
     return int(re.search(r'\d+', line)[0])
 
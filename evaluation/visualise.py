@@ -1,22 +1,37 @@
 from optparse import OptionParser
 from pathlib import Path
-import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
 import json
 import re
 import csv
-from matplotlib import rcParams
 import collections
-
-rcParams['font.family'] = 'serif'
-rcParams['font.sans-serif'] = ['Palatino']
-rcParams['font.serif'] = ['Palatino']
-rcParams["font.size"] = "10"
-rcParams['text.usetex'] ='false'
-rcParams["font.weight"] = "normal" # does not work :/
-rcParams["axes.labelweight"] = "normal" # does not work :/
-rcParams['figure.dpi'] = "300" 
+import multiprocessing
+import os
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('..')))
+from concurrent.futures import ProcessPoolExecutor
+from dataset.creation.profiling import profiler
+
+# matplotlib (about a second) and numpy are imported on first use
+# interactive: plt.show() is used, the default backend is kept if there is a display (else the charts are only saved, with 'Agg')
+def get_pyplot(interactive=False):
+    import matplotlib
+    if 'matplotlib.pyplot' not in sys.modules and (not interactive or not has_display()):
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib import rcParams
+
+    rcParams['font.family'] = 'serif'
+    rcParams['font.sans-serif'] = ['Palatino']
+    rcParams['font.serif'] = ['Palatino']
+    rcParams["font.size"] = "10"
+    rcParams['text.usetex'] ='false'
+    rcParams["font.weight"] = "normal" # does not work :/
+    rcParams["axes.labelweight"] = "normal" # does not work :/
+    rcParams['figure.dpi'] = "300" 
+    return plt
+
+def has_display():
+    return sys.platform in ['darwin', 'win32'] or 'DISPLAY' in os.environ or 'WAYLAND_DISPLAY' in os.environ
 
 def main():
     parser = OptionParser()
@@ -28,81 +43,109 @@ def main():
                     '--output',
                     dest = 'output',
                     metavar = 'FOLDER' )
+    parser.add_option( '-t',
+                    '--top',
+                    dest = 'top',
+                    type = 'int',
+                    default = 10)
+    parser.add_option( '-f',
+                    '--format',
+                    dest = 'format',
+                    choices = ['pdf', 'png'],
+                    default = 'pdf')
+    parser.add_option( '-w',
+                    '--workers',
+                    dest = 'workers',
+                    type = 'int')
+    parser.add_option( '--profile',
+                    dest = 'profile',
+                    metavar = 'FOLDER')
+    parser.add_option( '--profile-mode',
+                    dest = 'profile_mode',
+                    choices = ['sample', 'cprofile'],
+                    default = 'sample')
+    parser.add_option( '--profile-rate',
+                    dest = 'profile_rate',
+                    type = 'float',
+                    default = 100.,
+                    metavar = 'HZ')
     (options, _) = parser.parse_args()
 
     in_path = str(Path(options.input))
     out_path = str(Path(options.output))
 
-    visualise_crawl(in_path, out_path)
+    profiler.configure(options.profile, options.profile_mode, options.profile_rate)
+    with profiler.profile('visualise'):
+        visualise_crawl(in_path, out_path, options.top, options.format, options.workers)
     # visualise_evaluation(in_path, out_path)
 
-def visualise_crawl(in_path, out_path):
+# top: the values after the top ones are folded into 'other' (bar and pie)
+# image_format: 'pdf' or 'png' (rasterized, much faster for big crawls)
+# workers: processes drawing the charts (Default is one per core)
+def visualise_crawl(in_path, out_path, top=10, image_format='pdf', workers=None):
     with open(in_path, 'r') as f:
         log = json.load(f)
 
+    # (kind, labels, values in %, save path)
+    charts = []
     for dic in log.keys():
         if dic == 'succeeded' or dic == 'failed':
             continue
+        folded = fold(log[dic], top)
+        labels = list(folded.keys())
+        values = [v * 100 for v in folded.values()]
 
         # BAR
-        xs = [i * 100 for i in list(log[dic].values())[:10]]
-        ys = list(log[dic].keys())[:10]
-
-        plt.barh(ys, xs, color='b')
-
-        # plt.title(dic)
-        plt.xlabel('Occurences in %')
-        plt.ylabel('Attributes')
-
-        plt.tight_layout()
-
-        save_path: str = str(Path(out_path).joinpath('bar').joinpath(dic)) + '.pdf'
-        Path(save_path).parent.mkdir(parents=True, exist_ok=True)
-        plt.savefig(save_path, bbox_inches='tight')
-        
-        plt.clf()
+        charts.append(('bar', labels, values, str(Path(out_path).joinpath('bar').joinpath(dic)) + '.' + image_format))
 
         # Dots
         if dic == 'font_weight_dict' or dic == 'font_size_dict':
-            temp = {}
-
-            for i, (k, v) in enumerate(log[dic].items()):
-                if i >= 10:
-                    break
-                temp[k] = v
-            od = collections.OrderedDict(sorted(temp.items()))
-
-            xs = [i * 100 for i in list(od.values())[:10]]
-            ys = list(od.keys())[:10]
-
-            plt.plot(ys, xs, 'bo')
-
-            # plt.title(dic)
-            plt.xlabel('Attributes')
-            plt.ylabel('Occurences in %')
-
-            plt.tight_layout()
-
-            save_path: str = str(Path(out_path).joinpath('dot').joinpath(dic)) + '.pdf'
-            Path(save_path).parent.mkdir(parents=True, exist_ok=True)
-            plt.savefig(save_path, bbox_inches='tight')
-
-            plt.clf()
+            od = collections.OrderedDict(sorted(list(log[dic].items())[:top]))
+            charts.append(('dot', list(od.keys()), [v * 100 for v in od.values()], str(Path(out_path).joinpath('dot').joinpath(dic)) + '.' + image_format))
 
         # PIE
-        # plt.pie(labels=list(log[dic].keys())[:10], x=list(log[dic].values())[:10])
-        plt.pie(labels=list(log[dic].keys()), x=list(log[dic].values()))
+        charts.append(('pie', labels, values, str(Path(out_path).joinpath('pie').joinpath(dic)) + '.' + image_format))
+
+    # Every chart gets its own process (and figure), spawn: pyplot must not be shared with a forked parent
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        for save_path in executor.map(draw_chart, charts):
+            print('created:\t' + save_path)
+
+# The top values (in the order of the crawl data, the most frequent first) and the sum of the rest as 'other'
+def fold(values, top):
+    items = list(values.items())
+    folded = collections.OrderedDict(items[:top])
+    rest = sum([v for _, v in items[top:]])
+    if rest > 0:
+        folded['other'] = folded.get('other', 0) + rest
+    return folded
+
+def draw_chart(chart):
+    kind, labels, values, save_path = chart
+    plt = get_pyplot()
+    fig, ax = plt.subplots()
 
-        # plt.title(dic)
-        plt.tight_layout()
+    if kind == 'bar':
+        ax.barh(labels, values, color='b')
+        ax.set_xlabel('Occurences in %')
+        ax.set_ylabel('Attributes')
+    elif kind == 'dot':
+        ax.plot(labels, values, 'bo')
+        ax.set_xlabel('Attributes')
+        ax.set_ylabel('Occurences in %')
+    else:
+        ax.pie(labels=labels, x=values)
+    fig.tight_layout()
 
-        save_path: str = str(Path(out_path).joinpath('pie').joinpath(dic)) + '.pdf'
-        Path(save_path).parent.mkdir(parents=True, exist_ok=True)
-        plt.savefig(save_path, bbox_inches='tight')
-        plt.clf()
-        # plt.show()
+    Path(save_path).parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(save_path, bbox_inches='tight')
+    plt.close(fig)
+    return save_path
 
 def visualise_evaluation(in_path, out_path):
+    import numpy as np
+    plt = get_pyplot()
     # path,tp_l,fp_l,fn_l,tp_d,fp_d,fn_d,time_l,time_d,time_c
 
     results: [{str: str}] = []
@@ -240,6 +283,7 @@ def visualise_evaluation(in_path, out_path):
 
 
 def create_dots(ys, label, xs, color, out_path):
+    plt = get_pyplot()
 
     # plt.axis(ys)
 
@@ -249,6 +293,7 @@ def create_dots(ys, label, xs, color, out_path):
 
 
 def show_hm(values, label, cps, lps):
+    plt = get_pyplot(interactive=True)
     fig, ax = plt.subplots()
 
     im, cbar = heatmap(values, cps, lps, ax=ax,
@@ -260,6 +305,7 @@ def show_hm(values, label, cps, lps):
     # plt.clf()
 
 def save_hm(values, label, cps, lps, out_path):
+    plt = get_pyplot()
     fig, ax = plt.subplots()
     plt.xlabel("lp")
     plt.ylabel("cp")
@@ -297,6 +343,8 @@ def heatmap(data, row_labels, col_labels, ax=None,
     **kwargs
         All other arguments are forwarded to `imshow`.
     """
+    import numpy as np
+    plt = get_pyplot()
 
     if not ax:
         ax = plt.gca()
@@ -361,6 +409,8 @@ def annotate_heatmap(im, data=None, valfmt="{x:.2f}",
         All other arguments are forwarded to each call to `text` used to create
         the text labels.
     """
+    import numpy as np
+    import matplotlib.ticker
 
     if not isinstance(data, (list, np.ndarray)):
         data = im.get_array()
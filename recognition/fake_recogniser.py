@@ -0,0 +1,105 @@
+# Stands in for './build/localiser' and './build/determiner' where Tesseract is not available (e.g. tests of recognise.py).
+# Same arguments and output format, the "recognized" boxes and words are the ideal ones next to the images with some noise:
+#   fake_recogniser.py input_img output               (localiser)
+#   fake_recogniser.py input_img input_txt output     (determiner)
+from pathlib import Path
+import argparse
+import random
+import re
+import sys
+import time
+
+letters: str = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz1234567890'
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Fake localiser (input_img output) or determiner (input_img input_txt output).')
+    parser.add_argument('paths', metavar='paths', type=str, nargs='+', help='input_img [input_txt] output')
+    parser.add_argument('--jitter', metavar='jitter', type=int, default=1, help='max pixels a box is moved (localiser, Default is 1)')
+    parser.add_argument('--drop', metavar='drop', type=float, default=0.05, help='share of missed boxes (localiser, Default is 0.05)')
+    parser.add_argument('--typo', metavar='typo', type=float, default=0.1, help='probability of a wrong character per word (determiner, Default is 0.1)')
+    parser.add_argument('--fail', metavar='fail', type=float, default=0., help='probability to crash after half of the images (Default is 0)')
+    parser.add_argument('--seed', metavar='seed', type=int, default=None, help='seed of the noise')
+    args = parser.parse_args()
+
+    if len(args.paths) not in [2, 3]:
+        print('Missing Arguments! (' + str(len(args.paths)) + ' provided, 2 or 3 needed)')
+        sys.exit(1)
+
+    rng: random.Random = random.Random(args.seed)
+    in_img: Path = Path(args.paths[0]).absolute()
+    in_txt: Path = Path(args.paths[1]).absolute() if len(args.paths) == 3 else None
+    out: Path = Path(args.paths[-1]).absolute()
+
+    imgs: [Path] = sorted(in_img.rglob('*.png'))
+    crash: int = len(imgs) // 2 if rng.random() < args.fail else -1
+    for i, img in enumerate(imgs):
+        if i == crash:
+            print('Crashed (fake)')
+            sys.exit(1)
+        print('Loading (png): ' + str(img))
+        begin: float = time.perf_counter()
+        ideal: [(str, [int])] = read_boxes(img.with_suffix('.txt'))
+        if in_txt is None:
+            lines: [str] = localise(rng, ideal, args.jitter, args.drop)
+        else:
+            lines = determine(rng, ideal, read_boxes(in_txt.joinpath(img.relative_to(in_img)).with_suffix('.txt')), args.typo)
+        microseconds: int = int((time.perf_counter() - begin) * 1000000)
+
+        out_path: Path = out.joinpath(img.relative_to(in_img)).with_suffix('.txt')
+        print('Writing (txt): ' + str(out_path))
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(str(out_path), 'w', encoding='utf-8') as f:
+            f.write('% Time (in microseconds):  ' + str(microseconds) + '\n')
+            for line in lines:
+                f.write(line + '\n')
+
+def localise(rng: random.Random, ideal: [(str, [int])], jitter: int, drop: float) -> [str]:
+    lines: [str] = []
+    for _, box in ideal:
+        if rng.random() < drop:
+            continue
+        box = [max(0, value + rng.randint(-jitter, jitter)) for value in box]
+        lines.append('\t' + format_box(box))
+    return lines
+
+# The word of the ideal box overlapping the most with every box to determine
+def determine(rng: random.Random, ideal: [(str, [int])], boxes: [(str, [int])], typo: float) -> [str]:
+    lines: [str] = []
+    for _, box in boxes:
+        word: str = ''
+        best: int = 0
+        for ideal_word, ideal_box in ideal:
+            overlap: int = get_overlap(box, ideal_box)
+            if overlap > best:
+                word = ideal_word
+                best = overlap
+        if len(word) > 0 and rng.random() < typo:
+            i: int = rng.randrange(len(word))
+            word = word[:i] + rng.choice(letters) + word[i + 1:]
+        lines.append(word + '\t' + format_box(box))
+    return lines
+
+def get_overlap(a: [int], b: [int]) -> int:
+    dx: int = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    dy: int = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    return dx * dy if dx > 0 and dy > 0 else 0
+
+def format_box(box: [int]) -> str:
+    return '(' + ','.join(str(value) for value in box) + ')'
+
+def read_boxes(txt: Path) -> [(str, [int])]:
+    boxes: [(str, [int])] = []
+    if not txt.exists():
+        return boxes
+    with open(str(txt), 'r', encoding='utf-8') as f:
+        for line in f:
+            if 'file:///' in line or '% Time' in line:
+                continue
+            match = re.search(r'(\d+),(\d+),(\d+),(\d+)', line)
+            if match is not None:
+                boxes.append((line.split('\t')[0], [int(value) for value in match.groups()]))
+    return boxes
+
+
+if __name__ == '__main__':
+    main()
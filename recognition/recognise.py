@@ -0,0 +1,242 @@
+# Runs a recognizer (localiser or determiner) over a rendered dataset with a cache of its results.
+# The cache is keyed by the hash of every image (and for the determiner the boxes it recognizes),
+# the recognizer only runs on the images which are not cached, the recognized txt tree is written from the cache.
+# The uncached images are split into shards, every shard is recognized by its own recognizer process (one Tesseract per core).
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('..')))
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+import argparse
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import tempfile
+import progressbar
+from dataset.creation.metrics import metrics
+from dataset.creation.profiling import profiler
+from dataset.creation.manifest import get_files
+
+script_path: Path = Path(__file__).parent.absolute()
+recognisers: [str] = ['localiser', 'determiner']
+commands: Dict[str, str] = {
+    'localiser': str(script_path.joinpath('localisation/build/localiser')),
+    'determiner': str(script_path.joinpath('determination/build/determiner')),
+}
+# Stands in for Tesseract (e.g. for tests)
+fake_command: str = shlex.quote(sys.executable) + ' ' + shlex.quote(str(script_path.joinpath('fake_recogniser.py')))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Recognize a rendered dataset, only images which are not cached are passed to the recognizer.')
+    # Recognizer
+    parser.add_argument('recogniser', metavar='recogniser', type=str, choices=recognisers, help='localiser or determiner')
+    # Image Directory
+    parser.add_argument('input_img', metavar='input_img', type=str, nargs=1, help='a directory containing the images')
+    # Output Directory
+    parser.add_argument('output', metavar='output', type=str, nargs=1, help='a directory for the recognized txt files')
+    # Box Directory
+    parser.add_argument('-b', '--boxes', metavar='input_txt', type=str, default=None, help='a directory containing the boxes to determine (determiner only, Default is input_img)')
+    # Cache Directory
+    parser.add_argument('-c', '--cache', metavar='cache', type=str, default=None, help='a directory for the cached results (Default is ocr_cache next to output)')
+    # Command
+    parser.add_argument('--command', metavar='command', type=str, default=None, help='command of the recognizer (Default is the build of localisation/determination)')
+    # Fake
+    parser.add_argument('--fake', action='store_true', help='use fake_recogniser.py instead of Tesseract')
+    # Workers
+    parser.add_argument('-w', '--workers', metavar='workers', type=int, default=1, help='how many recognizer processes should run in parallel? (Default is 1)')
+    # Retries
+    parser.add_argument('-r', '--retries', metavar='retries', type=int, default=2, help='how often the images of a failed shard are recognized again (Default is 2)')
+    # Profiling
+    parser.add_argument('--profile', metavar='folder', type=str, default=None, help='save a sampled (and with --profile-mode cprofile a cProfile) profile of the run to this folder')
+    parser.add_argument('--profile-mode', metavar='mode', type=str, choices=['sample', 'cprofile'], default='sample', help='sample (cheap) or cprofile (deterministic, slow) (Default is sample)')
+    parser.add_argument('--profile-rate', metavar='hz', type=float, default=100., help='samples per second (Default is 100)')
+    args = parser.parse_args()
+
+    output: Path = Path(args.output[0]).absolute()
+    cache: str = args.cache if args.cache is not None else str(output.parent.joinpath('ocr_cache'))
+    command: str = fake_command if args.fake else args.command
+    profiler.configure(args.profile, args.profile_mode, args.profile_rate)
+    with profiler.profile('recognise'):
+        recognise(args.recogniser, args.input_img[0], str(output), args.boxes, cache, command, args.workers, args.retries)
+
+# The recognition of complete_pipeline.sh: localised, determined on the ideal boxes and determined on the localised boxes (complete)
+def recognise_dataset(dataset: str, cache: str, workers: int = 1, retries: int = 2, fake: bool = False) -> None:
+    localiser: str = fake_command if fake else None
+    determiner: str = fake_command if fake else None
+    recognise('localiser', dataset, dataset + '_tesseract_localised', None, cache, localiser, workers, retries)
+    recognise('determiner', dataset, dataset + '_tesseract_determiner', dataset, cache, determiner, workers, retries)
+    recognise('determiner', dataset, dataset + '_tesseract_complete', dataset + '_tesseract_localised', cache, determiner, workers, retries)
+
+
+# recogniser: 'localiser' (input_img -> boxes) or 'determiner' (input_img + boxes in input_txt -> words)
+# command: the recognizer is called as 'command input_img output' or 'command input_img input_txt output'
+# workers: recognizer processes running in parallel, retries: how often the images without a result are recognized again
+def recognise(recogniser: str, in_imgs: str, out: str, in_txts: str = None, cache: str = './ocr_cache', command: str = None, workers: int = 1, retries: int = 2) -> None:
+    input_img_path: Path = Path(in_imgs).absolute()
+    input_txt_path: Path = Path(in_txts if in_txts is not None else in_imgs).absolute()
+    output_path: Path = Path(out).absolute()
+    cache_path: Path = Path(cache).absolute().joinpath(recogniser)
+    cache_path.mkdir(parents=True, exist_ok=True)
+    command = command if command is not None else commands[recogniser]
+
+    print('recogniser:\t' + recogniser)
+    print('input_img:\t' + str(input_img_path))
+    if recogniser == 'determiner':
+        print('input_txt:\t' + str(input_txt_path))
+    print('output:\t\t' + str(output_path))
+    print('cache:\t\t' + str(cache_path))
+
+    stage = metrics.stage('recognise_' + recogniser)
+    stage.start()
+
+    # Different recognizers (or builds of them) must not share results
+    tag: str = get_command_hash(command)
+    hashes: ImageHashes = ImageHashes(cache_path.joinpath('images.json'))
+
+    files: [Path] = get_files(input_img_path, '.png')
+    keys: Dict[Path, str] = {}
+    missing: [Path] = []
+    with stage.phase('hash'):
+        for file in files:
+            key: str = tag + hashes.get(file)
+            if recogniser == 'determiner':
+                key += get_boxes(input_txt_path.joinpath(file.relative_to(input_img_path)).with_suffix('.txt'))
+            keys[file] = hashlib.sha256(key.encode('utf-8')).hexdigest()
+            if not get_cached(cache_path, keys[file]).exists():
+                missing.append(file)
+    hashes.save()
+    stage.count('cached', len(files) - len(missing))
+    stage.count('recognized', len(missing))
+    print(str(len(files) - len(missing)) + ' of ' + str(len(files)) + ' images are cached')
+
+    if len(missing) > 0:
+        with stage.phase('recognise'):
+            shards: [[Path]] = [missing[i::workers] for i in range(min(max(1, workers), len(missing)))]
+            for attempt in range(retries + 1):
+                if attempt > 0:
+                    print('retrying ' + str(sum(len(shard) for shard in shards)) + ' images in ' + str(len(shards)) + ' shards (' + str(attempt) + '/' + str(retries) + ')')
+                    stage.count('retried_shards', len(shards))
+                with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+                    failed: [[Path]] = list(executor.map(lambda shard: run_recogniser(recogniser, command, shard, input_img_path, input_txt_path, cache_path, keys), shards))
+                shards = [shard for shard in failed if len(shard) > 0]
+                if len(shards) == 0:
+                    break
+
+    # Materialize the recognized tree
+    with stage.phase('materialize'):
+        for file in progressbar.progressbar(files):
+            cached: Path = get_cached(cache_path, keys[file])
+            if not cached.exists():
+                print('not recognized:\t' + str(file))
+                continue
+            save: Path = output_path.joinpath(file.relative_to(input_img_path)).with_suffix('.txt')
+            save.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(str(cached), str(save))
+            stage.add_item(0.)
+    stage.stop()
+    print('created:\t' + str(output_path))
+
+# Runs the recognizer on a staging directory of links to the images of one shard and moves its results into the cache
+# Returns the images without a result
+def run_recogniser(recogniser: str, command: str, files: [Path], input_img_path: Path, input_txt_path: Path, cache_path: Path, keys: Dict[Path, str]) -> [Path]:
+    with tempfile.TemporaryDirectory(dir=str(cache_path)) as staging:
+        staging_img: Path = Path(staging).joinpath('img')
+        staging_txt: Path = Path(staging).joinpath('txt')
+        staging_out: Path = Path(staging).joinpath('out')
+        for file in files:
+            relative_path: Path = file.relative_to(input_img_path)
+            link(file, staging_img.joinpath(relative_path))
+            # the ideal boxes next to the image (not used by the recognizers)
+            if file.with_suffix('.txt').exists():
+                link(file.with_suffix('.txt'), staging_img.joinpath(relative_path).with_suffix('.txt'))
+            if recogniser == 'determiner':
+                link(input_txt_path.joinpath(relative_path).with_suffix('.txt'), staging_txt.joinpath(relative_path).with_suffix('.txt'))
+
+        arguments: [str] = [str(staging_img), str(staging_out)]
+        if recogniser == 'determiner':
+            arguments = [str(staging_img), str(staging_txt), str(staging_out)]
+        log_path: Path = Path(staging).joinpath('log.txt')
+        with open(str(log_path), 'w') as log:
+            returncode: int = subprocess.call(shlex.split(command) + arguments, stdout=log, stderr=subprocess.STDOUT)
+        if returncode != 0:
+            print('recogniser failed (' + str(returncode) + '):')
+            with open(str(log_path), 'r') as log:
+                print(''.join(log.readlines()[-20:]))
+
+        failed: [Path] = []
+        for file in files:
+            result: Path = staging_out.joinpath(file.relative_to(input_img_path)).with_suffix('.txt')
+            if result.exists():
+                cached: Path = get_cached(cache_path, keys[file])
+                cached.parent.mkdir(parents=True, exist_ok=True)
+                # rename: a cache entry is either complete or missing
+                os.replace(str(result), str(cached))
+            else:
+                failed.append(file)
+        return failed
+
+def link(source: Path, link_path: Path) -> None:
+    link_path.parent.mkdir(parents=True, exist_ok=True)
+    os.symlink(str(source), str(link_path))
+
+def get_cached(cache_path: Path, key: str) -> Path:
+    return cache_path.joinpath(key[:2], key + '.txt')
+
+# The boxes as the determiner reads them (the first 4 numbers of every line)
+def get_boxes(txt: Path) -> str:
+    boxes: [str] = []
+    try:
+        with open(str(txt), 'r', encoding='utf-8') as f:
+            for line in f:
+                match = re.search(r'([0-9]+),([0-9]+),([0-9]+),([0-9]+)', line)
+                if match is not None:
+                    boxes.append(','.join(match.groups()))
+    except FileNotFoundError:
+        pass
+    return ';'.join(boxes)
+
+def get_command_hash(command: str) -> str:
+    sha = hashlib.sha256(command.encode('utf-8'))
+    for argument in shlex.split(command):
+        if Path(argument).is_file():
+            sha.update(get_file_hash(Path(argument)).encode('utf-8'))
+    return sha.hexdigest()
+
+def get_file_hash(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(str(path), 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+# Hashes of the images, only rehashed if their size or modification time changed
+class ImageHashes(object):
+    def __init__(self, path: Path) -> None:
+        self.path: Path = path
+        self.hashes: Dict[str, list] = {}
+        if path.exists():
+            with open(str(path), 'r') as f:
+                self.hashes = json.load(f)
+
+    def get(self, file: Path) -> str:
+        stat = file.stat()
+        entry: list = self.hashes.get(str(file))
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        sha: str = get_file_hash(file)
+        self.hashes[str(file)] = [stat.st_size, stat.st_mtime_ns, sha]
+        return sha
+
+    def save(self) -> None:
+        tmp: Path = self.path.with_suffix('.tmp')
+        with open(str(tmp), 'w') as f:
+            json.dump(self.hashes, f)
+        os.replace(str(tmp), str(self.path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+# Startup budget of the entry points (benchmark/run.py --import-budget): every one is imported in a fresh interpreter,
+# it must stay below the budget and must not import CEF, pyppeteer, cv2 or matplotlib (main.py imports the stages when they run)
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent.absolute().joinpath('..')))
+import pytest
+
+from benchmark.run import bench_import, entry_modules
+
+# ms, generous: the entry points import in well under 100 ms, a heavy module takes about a second
+budget: float = 500.
+
+@pytest.mark.parametrize('module', entry_modules)
+def test_import_budget(module: str) -> None:
+    result: dict = bench_import(module, 3)
+    assert result['heavy'] == [], module + ' imports ' + ', '.join(result['heavy'])
+    assert result['seconds'] * 1000 <= budget, module + ' takes %.0f ms to import' % (result['seconds'] * 1000)